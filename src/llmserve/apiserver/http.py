@@ -1,18 +1,92 @@
 # SPDX-License-Identifier: Apache-2.0
 from __future__ import annotations
-from fastapi import FastAPI, HTTPException, Header
-from fastapi.responses import JSONResponse, StreamingResponse
+import hashlib, os, sys
+from collections import OrderedDict
+from typing import Literal
+from fastapi import FastAPI, HTTPException, Header, Request, Response
+from fastapi.responses import ORJSONResponse, StreamingResponse
 import orjson
+from pydantic import AliasChoices, BaseModel, Field, TypeAdapter, ValidationError, field_validator
+from ..scheduler.fairshare import DecodeError
 from ..util.ratelimit import RateLimitError
+from .version import version_payload
+
+
+# accepted spellings of strategy/workload -> interned canonical value, so the
+# common already-canonical case is one dict hit with no .lower() allocation
+_CANONICAL = {}
+for _v in ("auto", "baseline", "speculative", "lookahead", "code", "math", "general"):
+    _v = sys.intern(_v)
+    for _spelling in (_v, _v.upper(), _v.capitalize()):
+        _CANONICAL[_spelling] = _v
+del _v, _spelling
+_ALLOWED = {
+    "strategy": frozenset(("auto", "baseline", "speculative", "lookahead")),
+    "workload": frozenset(("code", "math", "general")),
+}
+_FALLBACK = {"strategy": "auto", "workload": "general"}
+
+
+class CompletionReq(BaseModel):
+    prompt: str = ""
+    stream: bool = False
+    tenant: str = "default"
+    # bounded so a single request cannot ask the router for a huge allocation
+    max_tokens: int = Field(default=256, gt=0, le=32768)
+    strategy: Literal["auto", "baseline", "speculative", "lookahead"] = Field(
+        default="auto", validation_alias=AliasChoices("strategy", "strategy_hint")
+    )
+    workload: Literal["code", "math", "general"] = "general"
+
+    # lenient like the dict-based handler before it: null/"" tenant, strategy
+    # or workload take the default, unknown values fall back to it too
+    @field_validator("tenant", mode="before")
+    @classmethod
+    def _tenant(cls, v):
+        return v or "default"
+
+    @field_validator("strategy", "workload", mode="before")
+    @classmethod
+    def _canonical(cls, v, info):
+        if v is None or v == "": return _FALLBACK[info.field_name]
+        if isinstance(v, str):
+            v = _CANONICAL.get(v) or v.lower()
+            return v if v in _ALLOWED[info.field_name] else _FALLBACK[info.field_name]
+        return v
+
+
+# constant NDJSON framing for stream deltas: {"delta":<json string>}\n
+_DELTA_PREFIX = b'{"delta":'
+_DELTA_SUFFIX = b'}\n'
+
+# built once; parses + validates the raw body in a single pydantic-core pass
+_ADAPTER = TypeAdapter(CompletionReq)
 
 def build_app(spec, router) -> FastAPI:
-    app = FastAPI(title="LLMServe", version="0.1.0")
+    # /docs, /redoc and the OpenAPI schema only in debug; skips schema introspection in prod
+    docs = {} if os.environ.get("LLMSERVE_DEBUG") else dict(docs_url=None, redoc_url=None, openapi_url=None)
+    app = FastAPI(title="LLMServe", version="0.1.0", default_response_class=ORJSONResponse, **docs)
+    # resolved once; the spec does not change after load
+    primary_id = spec.models["primary"].id
+    # probes hit this at high frequency; serialize once and reuse the response
+    health_resp = Response(b'{"status":"ok"}', media_type="application/json")
+    # opt-in completion cache keyed on SHA256 of the stable request tuple
+    rc = spec.response_cache
+    cache: OrderedDict[bytes, str] | None = OrderedDict() if rc.enabled else None
+    cache_max = rc.max_entries
+
+    # rendered once per app; the spec does not change after load
+    app.state.version_string = sys.intern(version_payload(spec))
+    version_resp = Response(app.state.version_string.encode("utf-8"), media_type="text/plain")
 
     @app.get("/healthz")
-    async def healthz(): return {"status": "ok"}
+    async def healthz(): return health_resp
+
+    @app.get("/version")
+    async def version(): return version_resp
 
-    @app.post("/v1/completions")
-    async def completions(body: dict, authorization: str | None = Header(default=None)):
+    @app.post("/v1/completions", response_class=ORJSONResponse)
+    async def completions(request: Request, authorization: str | None = Header(default=None)):
         '''
         curl -X POST http://localhost:8000/v1/completions \
         -H "Content-Type: application/json" \
@@ -25,31 +99,73 @@ def build_app(spec, router) -> FastAPI:
             "tenant": "premium"
             }               
         '''
-        prompt = body.get("prompt")
-        stream = bool(body.get("stream", False))
-        tenant = body.get("tenant") or "default"
-        max_tokens = int(body.get("max_tokens", 256))
-        strategy_hint = (body.get("strategy") or body.get("strategy_hint") or "auto").lower()
-        workload = (body.get("workload") or "general").lower()
+        try:
+            req = _ADAPTER.validate_json(await request.body())
+        except ValidationError as ve:
+            raise HTTPException(400, ve.errors(include_url=False, include_context=False, include_input=False))
+        prompt = req.prompt
+        stream = req.stream
+        tenant = req.tenant
+        max_tokens = req.max_tokens
+        strategy_hint = req.strategy
+        workload = req.workload
         if not prompt: raise HTTPException(400, "prompt is required")
+        # same check Router.submit_and_stream makes, against the router's own
+        # buckets; up front here so a streaming request gets a real 429
+        assess = router.rate.assess(tenant, max(1, len(prompt) // 4))
+        if assess.policy == "reject" and assess.tokens_deficit > 0:
+            from ..metrics.prometheus import RATE_LIMIT_REJECTS
+            RATE_LIMIT_REJECTS.labels(tenant=tenant, reason="tokens@http").inc()
+            raise HTTPException(status_code=429, detail=f"rate_limited: {tenant}:tokens")
 
         try:
             if not stream:
-                text = await router.complete(prompt, tenant=tenant,
-                                 opts={"max_tokens": max_tokens,
-                                       "strategy_hint": strategy_hint,
-                                       "workload": workload})
-                return JSONResponse({"model": spec.models["primary"].id, "choices": [{"index": 0, "text": text}]})
+                key = text = None
+                if cache is not None:
+                    key = hashlib.sha256("\x1f".join(
+                        (prompt, primary_id, tenant, str(max_tokens), strategy_hint, workload)
+                    ).encode("utf-8")).digest()
+                    text = cache.get(key)
+                    if text is not None:
+                        cache.move_to_end(key)
+                if text is None:
+                    text = await router.complete(prompt, tenant=tenant,
+                                     opts={"max_tokens": max_tokens,
+                                           "strategy_hint": strategy_hint,
+                                           "workload": workload})
+                    # only completed text reaches here: rejects/failures raise
+                    if key is not None:
+                        cache[key] = text
+                        if len(cache) > cache_max:
+                            cache.popitem(last=False)
+                payload = orjson.dumps({"model": primary_id, "choices": [{"index": 0, "text": text}]})
+                return Response(payload, media_type="application/json")
 
             async def gen():
-                async for chunk in router.submit_and_stream(prompt, tenant=tenant,
-                                               opts={"max_tokens": max_tokens,
-                                                     "strategy_hint": strategy_hint,
-                                                     "workload": workload}):
-                    yield orjson.dumps({"delta": chunk}).decode() + "\n"
+                # one frame buffer per connection instead of two temporaries per delta
+                buf = bytearray()
+                try:
+                    async for chunk in router.submit_and_stream(prompt, tenant=tenant,
+                                                   opts={"max_tokens": max_tokens,
+                                                         "strategy_hint": strategy_hint,
+                                                         "workload": workload}):
+                        buf += _DELTA_PREFIX
+                        buf += orjson.dumps(chunk)
+                        buf += _DELTA_SUFFIX
+                        out = bytes(buf)
+                        buf.clear()
+                        yield out
+                except RateLimitError as e:
+                    # status line is already sent; end with an error frame, not silently
+                    yield orjson.dumps({"error": f"rate_limited: {e.tenant}:{e.reason}"}) + b"\n"
+                except DecodeError as e:
+                    yield orjson.dumps({"error": f"{'timeout' if e.timeout else 'decode_failed'}: {e}"}) + b"\n"
             return StreamingResponse(gen(), media_type="application/jsonl")
 
         except RateLimitError as e:
             raise HTTPException(status_code=429, detail=f"rate_limited: {e.tenant}:{e.reason}")
+        except DecodeError as e:
+            if e.timeout: raise HTTPException(status_code=504, detail=f"timeout: {e}")
+            raise HTTPException(status_code=502, detail=f"decode_failed: {e}")
 
     return app
\ No newline at end of file
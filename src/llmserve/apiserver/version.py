@@ -1,6 +1,12 @@
 from __future__ import annotations
 
+# single-slot memo: the spec is loaded once per process and never mutated
+_last: tuple[object, str] | None = None
+
 def version_payload(spec) -> str:
+    global _last
+    if _last is not None and _last[0] is spec:
+        return _last[1]
     m = spec.models["primary"]
     draft = spec.draft
     parts = [
@@ -12,4 +18,6 @@ def version_payload(spec) -> str:
     ]
     if draft and draft.enabled:
         parts.append(f"speculative={draft.id}:{draft.speculative_tokens}")
-    return " | ".join(parts)
\ No newline at end of file
+    out = " | ".join(parts)
+    _last = (spec, out)
+    return out
\ No newline at end of file
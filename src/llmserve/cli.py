@@ -1,16 +1,22 @@
 from __future__ import annotations
-import asyncio
-import os, sys, subprocess
+import os
 import typer
-from rich import print as rprint
-from grpc_tools import protoc
 from . import __version__
-from .config import load_manifest
-from .runner import Orchestrator
-from .deploy.k8sgen import render_all, write_out
+
+# Heavy subsystems (rich, grpc_tools, pydantic config, engines) are imported
+# inside the commands that need them so `llmserve version` stays cheap.
 
 app = typer.Typer(add_completion=False, help="LLMServe CLI")
 
+def _run(coro):
+    # uvloop (shipped with uvicorn[standard]) when available; stdlib loop otherwise
+    try:
+        import uvloop
+    except ImportError:
+        import asyncio
+        return asyncio.run(coro)
+    return uvloop.run(coro)
+
 @app.callback()
 def _global(
     verbose: bool = typer.Option(False, "--verbose", "-v", help="Verbose logging"),
@@ -30,7 +36,14 @@ def up(
     svc_type: str = typer.Option("LoadBalancer", "--service-type", help="ClusterIP|NodePort|LoadBalancer"),
     out_dir: str = typer.Option("deploy_out/k8s", "--out-dir", help="Where to write generated YAML in k8s mode"),
     apply: bool = typer.Option(False, "--apply", help="Run `kubectl apply -f` on the out-dir"),
+    bundle: bool = typer.Option(False, "--bundle", help="Write a single manifests.tar instead of one file per doc"),
+    roles: str = typer.Option(None, "--roles", help="Comma-separated subset of router,prefill,decode to render (disaggregated only)"),
+    cluster_scoped: bool = typer.Option(True, "--cluster-scoped/--no-cluster-scoped", help="Emit Namespace and StorageClass docs"),
 ):
+    from rich import print as rprint
+    from .config import load_manifest
+    from .runner import Orchestrator
+
     spec = load_manifest(manifest)
 
     role = os.environ.get("ROLE", "").lower()
@@ -39,30 +52,44 @@ def up(
     if mode == "local" and not role:
         if spec.deployment.disaggregated:
             # run router only in local disaggregated mode for now
-            asyncio.run(orch.run_router(host=host, port=spec.deployment.router_port, metrics_port=metrics_port))
+            _run(orch.run_router(host=host, port=spec.deployment.router_port, metrics_port=metrics_port))
         else:
-            asyncio.run(orch.run_local(host=host, port=port, metrics_port=metrics_port))
+            _run(orch.run_local(host=host, port=port, metrics_port=metrics_port))
         return
 
     if role == "router":
-        asyncio.run(orch.run_router(host=host, port=spec.deployment.router_port, metrics_port=metrics_port)); return
+        _run(orch.run_router(host=host, port=spec.deployment.router_port, metrics_port=metrics_port)); return
     if role == "prefill":
-        asyncio.run(orch.run_prefill_worker(host=host, port=spec.deployment.prefill_port, metrics_port=metrics_port)); return
+        _run(orch.run_prefill_worker(host=host, port=spec.deployment.prefill_port, metrics_port=metrics_port)); return
     if role == "decode":
-        asyncio.run(orch.run_decode_worker(host=host, port=spec.deployment.decode_port, metrics_port=metrics_port)); return
+        _run(orch.run_decode_worker(host=host, port=spec.deployment.decode_port, metrics_port=metrics_port)); return
+    if role == "workers":
+        _run(orch.run_workers(host=host, metrics_port=metrics_port)); return
 
 
     if mode != "k8s":
         rprint(f"[red]Unknown mode {mode}[/red]"); raise typer.Exit(1)
+    if bundle and apply:
+        rprint("[red]--apply needs per-file output; drop --bundle[/red]"); raise typer.Exit(1)
 
     # Render manifests
-    docs = render_all(spec, namespace=namespace, image=image, svc_type=svc_type)
+    from .deploy.k8sgen import render_all_iter, write_out
+    role_set = {r.strip() for r in roles.split(",") if r.strip()} if roles is not None else None
+    if role_set is not None:
+        bad = sorted(role_set - {"router", "prefill", "decode"})
+        if bad or not role_set:
+            rprint(f"[red]--roles takes router,prefill,decode; got {roles!r}[/red]"); raise typer.Exit(1)
+        if not spec.deployment.disaggregated:
+            rprint("[red]--roles needs deployment.disaggregated: the monolith is one pod[/red]"); raise typer.Exit(1)
+    docs = render_all_iter(spec, namespace=namespace, image=image, svc_type=svc_type, roles=role_set,
+                           emit_cluster_scoped=cluster_scoped)
     with open(manifest, "r", encoding="utf-8") as f:
         manitext = f.read()
-    outdir = write_out(out_dir, docs, manitext)
+    outdir = write_out(out_dir, docs, manitext, bundle=bundle)
     rprint(f"[green]Rendered K8s manifests to[/green] {outdir}")
 
     if apply:
+        import subprocess
         cmd = ["kubectl", "apply", "-f", str(outdir)]
         rprint(f"[cyan]Applying:[/cyan] {' '.join(cmd)}")
         try:
@@ -75,20 +102,26 @@ def up(
 def apply(
     manifest: str = typer.Option("llmserve.yaml", "--manifest", "-f"),
 ):
+    from rich import print as rprint
+    from .config import load_manifest
     spec = load_manifest(manifest)
     rprint("[green]Manifest OK[/green]")
     rprint("Suggested deploy: deploy/k8s/* (use ConfigMap to mount your manifest)")
 
 @app.command(help="Quick health/status (stub).")
 def status():
+    from rich import print as rprint
     rprint("router: OK | prefill: 0/0 (stub) | decode: 0/0 (stub) | kv-manager: 0/0 (stub)")
 
 @app.command(help="Show CLI/package version.")
 def version():
+    from rich import print as rprint
     rprint(f"llmserve {__version__}")
 
 @app.command(help="Generate gRPC stubs from protos/ into src/")
 def gen_proto():
+    from grpc_tools import protoc
+    from rich import print as rprint
     code = protoc.main([
         "protoc",
         "-I", "protos",
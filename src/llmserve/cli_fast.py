@@ -0,0 +1,26 @@
+# SPDX-License-Identifier: Apache-2.0
+from __future__ import annotations
+import sys
+
+# Console entry point. `version` and `status` are answered here without
+# importing typer/click/rich or the config/engine stack; everything else is
+# handed to the full Typer app in cli.py.
+
+def _version() -> None:
+    from . import __version__
+    print(f"llmserve {__version__}")
+
+def _status() -> None:
+    print("router: OK | prefill: 0/0 (stub) | decode: 0/0 (stub) | kv-manager: 0/0 (stub)")
+
+_FAST = {"version": _version, "status": _status}
+
+def main() -> None:
+    if len(sys.argv) == 2 and sys.argv[1] in _FAST:
+        _FAST[sys.argv[1]]()
+        return
+    from .cli import app
+    app()
+
+if __name__ == "__main__":
+    main()
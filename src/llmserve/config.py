@@ -5,6 +5,11 @@ from pathlib import Path
 import yaml
 from pydantic import BaseModel, Field, ValidationError, model_validator
 
+try:  # LibYAML-backed parser when available
+    from yaml import CSafeLoader as _YamlLoader
+except ImportError:  # pragma: no cover
+    from yaml import SafeLoader as _YamlLoader
+
 
 # =========================
 # Models (existing)
@@ -38,7 +43,15 @@ class SchedulingPolicies(BaseModel):
     min_decode_slots: int = 2
     queue_max_len: int = 2000
     prefix_awareness: bool = True
+    # route local decodes by prompt prefix (first 512 chars) instead of
+    # round-robin; pays off only when many requests share long prefixes
+    decode_prefix_affinity: bool = False
     aging_seconds: float = 2.0
+    # vLLM engine knobs (chunked_prefill above maps to enable_chunked_prefill)
+    gpu_memory_utilization: float = Field(default=0.95, gt=0.0, le=1.0)
+    max_num_batched_tokens: int | None = None  # None = vLLM default
+    prefill_eager: bool = True  # enforce_eager for prefill workers; decode keeps CUDA graphs
+    num_scheduler_steps: int | None = Field(default=None, ge=1)  # decode multi-step scheduling; None = vLLM default
 
 
 class RateLimitCfg(BaseModel):
@@ -56,9 +69,13 @@ class RateLimitCfg(BaseModel):
     penalty_window_ms: int = 2000
 
 
+# shared fallback for tenants without explicit limits; treated as read-only
+_DEFAULT_RL = RateLimitCfg()
+
+
 class SchedulingCfg(BaseModel):
     fair_share: dict[str, dict] = Field(default_factory=dict)
-    policies: SchedulingPolicies = SchedulingPolicies()
+    policies: SchedulingPolicies = Field(default_factory=SchedulingPolicies)
     rate_limits: dict[str, RateLimitCfg] = Field(default_factory=dict)
 
 
@@ -86,7 +103,10 @@ class KVCfg(BaseModel):
     prefix_caching: bool = True
     hbm_dtype: str = "fp16"
     disk_dtype: str = "int8"
-    eviction: EvictionCfg = EvictionCfg()
+    eviction: EvictionCfg = Field(default_factory=EvictionCfg)
+    # prefill workers only; 0 = off (vLLM cpu_offload_gb / swap_space)
+    prefill_cpu_offload_gb: float = Field(default=0.0, ge=0.0)
+    prefill_swap_space_gib: int = Field(default=0, ge=0)
 
 
 class StorageClassCfg(BaseModel):
@@ -134,6 +154,13 @@ class SecurityCfg(BaseModel):
     api_keys: list[str] = Field(default_factory=list)
 
 
+class ResponseCacheCfg(BaseModel):
+    # in-process LRU of non-streaming completions; off by default because
+    # sampled outputs are not deterministic
+    enabled: bool = False
+    max_entries: int = Field(default=1024, ge=1)
+
+
 # =========================
 # Plugins & Strategies
 # =========================
@@ -193,16 +220,27 @@ class RoleParallelismCfg(BaseModel):
     )
 
 class RolesCfg(BaseModel):
-    prefill: RoleParallelismCfg = RoleParallelismCfg()
-    decode: RoleParallelismCfg = RoleParallelismCfg()
+    prefill: RoleParallelismCfg = Field(default_factory=RoleParallelismCfg)
+    decode: RoleParallelismCfg = Field(default_factory=RoleParallelismCfg)
 
 
 class RPCCfg(BaseModel):
     scheme: Literal["grpc"] = "grpc"
     prefill_service: str = "llmserve-prefill:9001"  # K8s service DNS:port
     decode_service: str = "llmserve-decode:9002"
-    timeout_s: float = 30.0
+    timeout_s: float = 30.0  # unary calls (PrefillChunk)
+    # opt-in deadline for a whole decode stream (None = none); bounds stalled
+    # workers holding a slot, so size it for the longest max_tokens allowed
+    decode_timeout_s: float | None = Field(default=None, gt=0.0)
     round_robin: bool = True  # client-side LB; fine with ClusterIP too
+    # HTTP/2 connections per worker service; >1 lifts the per-connection
+    # concurrent-stream cap (~100) for high decode fan-out
+    channels_per_service: int = Field(default=1, ge=1)
+    # request compression (prompts); responses are small deltas and stay raw
+    compression: Literal["none", "gzip"] = "none"
+    # prompts estimated below this many tokens skip the remote prefill hop and
+    # are prefilled locally by the decode worker (0 = always disaggregate)
+    routing_threshold_tokens: int = Field(default=0, ge=0)
 
 # =========================
 # Top-level Spec
@@ -219,28 +257,29 @@ class SpecCfg(BaseModel):
     decode_strategy: Literal["baseline", "speculative", "lookahead", "hybrid"] = (
         "baseline"
     )
-    spec_decode: SpecDecodeCfg = SpecDecodeCfg()
-    lookahead: LookaheadCfg = LookaheadCfg()
-    hybrid: HybridCfg = HybridCfg()
+    spec_decode: SpecDecodeCfg = Field(default_factory=SpecDecodeCfg)
+    lookahead: LookaheadCfg = Field(default_factory=LookaheadCfg)
+    hybrid: HybridCfg = Field(default_factory=HybridCfg)
 
     # execution policies & limits
-    scheduling: SchedulingCfg = SchedulingCfg()
-    budgets: BudgetsCfg = BudgetsCfg()
+    scheduling: SchedulingCfg = Field(default_factory=SchedulingCfg)
+    budgets: BudgetsCfg = Field(default_factory=BudgetsCfg)
 
     # kv + storage + transfers
-    kv_cache: KVCfg = KVCfg()
+    kv_cache: KVCfg = Field(default_factory=KVCfg)
     storageClasses: list[StorageClassCfg] = Field(default_factory=list)
-    transfer: TransferCfg = TransferCfg()
+    transfer: TransferCfg = Field(default_factory=TransferCfg)
 
     # deploy & security
-    deployment: DeployCfg = DeployCfg()
-    security: SecurityCfg = SecurityCfg()
+    deployment: DeployCfg = Field(default_factory=DeployCfg)
+    security: SecurityCfg = Field(default_factory=SecurityCfg)
+    response_cache: ResponseCacheCfg = Field(default_factory=ResponseCacheCfg)
 
     # telemetry/tuning
-    telemetry: TelemetryCfg = TelemetryCfg()
+    telemetry: TelemetryCfg = Field(default_factory=TelemetryCfg)
 
-    roles: RolesCfg = RolesCfg()      # <— NEW
-    rpc: RPCCfg = RPCCfg()
+    roles: RolesCfg = Field(default_factory=RolesCfg)      # <— NEW
+    rpc: RPCCfg = Field(default_factory=RPCCfg)
 
     @model_validator(mode="after")
     def _validate_spec(self):
@@ -250,8 +289,7 @@ class SpecCfg(BaseModel):
                     "spec_decode.method=draft requires spec_decode.draft_model"
                 )
         # sensible defaults for rate limits
-        if "default" not in self.scheduling.rate_limits:
-            self.scheduling.rate_limits["default"] = RateLimitCfg()
+        self.scheduling.rate_limits.setdefault("default", _DEFAULT_RL)
         return self
 
 
@@ -272,8 +310,11 @@ def load_manifest(path: str | Path) -> SpecCfg:
     if not p.exists():
         raise FileNotFoundError(f"Manifest not found: {p}")
     try:
-        raw = yaml.safe_load(p.read_text())
-        m = Manifest(**raw)
+        if p.suffix == ".json":
+            # pydantic-core parses + validates JSON in one pass, no intermediate dict
+            m = Manifest.model_validate_json(p.read_bytes())
+        else:
+            m = Manifest.model_validate(yaml.load(p.read_bytes(), Loader=_YamlLoader))
     except ValidationError as ve:
         raise SystemExit(f"Manifest validation error:\n{ve}") from ve
     if m.kind != "LLMServe":
@@ -0,0 +1,174 @@
+# SPDX-License-Identifier: Apache-2.0
+# Shared YAML fragments for the K8s renderers.
+#
+# Fragments are returned at column 0 and placed into the deployment templates
+# with `_indent`. Everything here is a pure function of small hashable inputs,
+# so results are memoized: router/prefill/decode (and the monolith) reuse the
+# same strings instead of re-running dedent + formatting per role.
+from __future__ import annotations
+import functools
+import textwrap
+
+
+def _yaml(doc: str) -> str:
+    return textwrap.dedent(doc).lstrip()
+
+
+# parameterized docs are dedented once at import; only .format runs per call
+_NS_TPL = _yaml("""
+    apiVersion: v1
+    kind: Namespace
+    metadata:
+      name: {namespace}
+      labels:
+        app.kubernetes.io/name: llmserve
+        app.kubernetes.io/part-of: llmserve
+    """)
+
+_CM_HEADER_TPL = _yaml("""
+    apiVersion: v1
+    kind: ConfigMap
+    metadata:
+      name: llmserve-manifest
+      namespace: {namespace}
+    data:
+      llmserve.yaml: |
+    """)
+
+# Common performance/env defaults, shared by every GPU pod through envFrom
+# instead of being repeated per container; adjust per-fabric if needed
+_ENV_CM_TPL = _yaml("""
+    apiVersion: v1
+    kind: ConfigMap
+    metadata:
+      name: llmserve-env
+      namespace: {namespace}
+    data:
+      NCCL_DEBUG: "WARN"
+      NCCL_P2P_LEVEL: "SYS"
+      NCCL_SOCKET_IFNAME: "eth0"
+      UCX_TLS: "rc,ud,mm,self"
+      UCX_NET_DEVICES: "eth0"
+      NVIDIA_VISIBLE_DEVICES: "all"
+      NVIDIA_DRIVER_CAPABILITIES: "compute,utility"
+    """)
+
+_PROM_ANNOTATIONS_TPL = _yaml("""
+    annotations:
+      prometheus.io/scrape: "true"
+      prometheus.io/port: "{metrics_port}"
+      prometheus.io/path: "/metrics"
+    """)
+
+_PVC_TPL = _yaml("""
+    apiVersion: v1
+    kind: PersistentVolumeClaim
+    metadata:
+      name: kvpages-pvc
+      namespace: {namespace}
+    spec:
+      accessModes: ["ReadWriteOnce"]
+      resources:
+        requests:
+          storage: 500Gi
+      storageClassName: fast-nvme
+    """)
+
+
+@functools.lru_cache(maxsize=None)
+def _indent(lines: str, spaces: int) -> str:
+    # default predicate already skips whitespace-only lines
+    return textwrap.indent(lines, " " * spaces)
+
+
+@functools.lru_cache(maxsize=None)
+def _ns(namespace: str) -> str:
+    return _NS_TPL.format(namespace=namespace)
+
+
+@functools.lru_cache(maxsize=None)
+def _cm_header(namespace: str) -> str:
+    # manifest body is appended (indented) by write_out
+    return _CM_HEADER_TPL.format(namespace=namespace)
+
+
+@functools.lru_cache(maxsize=None)
+def _env_cm(namespace: str) -> str:
+    return _ENV_CM_TPL.format(namespace=namespace)
+
+
+@functools.lru_cache(maxsize=None)
+def _env_from() -> str:
+    # GPU containers pull the shared env from the llmserve-env ConfigMap
+    return _yaml("""
+    envFrom:
+      - configMapRef:
+          name: llmserve-env
+    """)
+
+
+@functools.lru_cache(maxsize=None)
+def _prom_annotations(metrics_port: int) -> str:
+    # same scrape annotations on every pod template; rendered once per port
+    return _PROM_ANNOTATIONS_TPL.format(metrics_port=metrics_port)
+
+
+@functools.lru_cache(maxsize=None)
+def _tolerations_yaml() -> str:
+    return _yaml("""
+    tolerations:
+      - key: "nvidia.com/gpu"
+        operator: "Exists"
+        effect: "NoSchedule"
+    """)
+
+
+@functools.lru_cache(maxsize=None)
+def _add_cfg_volume_mounts(kvpages: bool) -> str:
+    parts = [_yaml("""
+    volumeMounts:
+      - name: cfg
+        mountPath: /app/llmserve.yaml
+        subPath: llmserve.yaml
+    """)]
+    if kvpages:
+        parts.append(_indent(_yaml("""
+        - name: kvpages
+          mountPath: /var/lib/kvpages
+        """), 2))
+    return "".join(parts)
+
+
+@functools.lru_cache(maxsize=None)
+def _add_pod_volumes(kvpages: bool) -> str:
+    parts = [_yaml("""
+    volumes:
+      - name: cfg
+        configMap:
+          name: llmserve-manifest
+    """)]
+    if kvpages:
+        parts.append(_indent(_yaml("""
+        - name: kvpages
+          persistentVolumeClaim:
+            claimName: kvpages-pvc
+        """), 2))
+    return "".join(parts)
+
+
+@functools.lru_cache(maxsize=None)
+def _pvc(namespace: str) -> str:
+    return _PVC_TPL.format(namespace=namespace)
+
+
+@functools.lru_cache(maxsize=None)
+def _sc() -> str:
+    return _yaml("""
+    apiVersion: storage.k8s.io/v1
+    kind: StorageClass
+    metadata:
+      name: fast-nvme
+    provisioner: kubernetes.io/no-provisioner
+    volumeBindingMode: WaitForFirstConsumer
+    reclaimPolicy: Delete
+    """)
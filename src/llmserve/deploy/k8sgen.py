@@ -1,67 +1,57 @@
 # SPDX-License-Identifier: Apache-2.0
 from __future__ import annotations
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+import functools
+import hashlib
+import io
+import json
 from pathlib import Path
-import textwrap
+from typing import BinaryIO, Iterable, Iterator, NamedTuple
 import os
+import tarfile
+from .. import __version__
+from .helpers import (
+    _yaml, _indent, _ns, _cm_header, _env_cm, _env_from, _tolerations_yaml,
+    _add_cfg_volume_mounts, _add_pod_volumes, _pvc, _sc, _prom_annotations,
+)
 
-def _yaml(doc: str) -> str:
-    return textwrap.dedent(doc).lstrip()
-
-def _env_block() -> str:
-    # Common performance/env defaults; adjust per-fabric if needed
-    return _yaml(f"""
-    env:
-      - name: NCCL_DEBUG
-        value: "WARN"
-      - name: NCCL_P2P_LEVEL
-        value: "SYS"
-      - name: NCCL_SOCKET_IFNAME
-        value: "eth0"
-      - name: UCX_TLS
-        value: "rc,ud,mm,self"
-      - name: UCX_NET_DEVICES
-        value: "eth0"
-      - name: NVIDIA_VISIBLE_DEVICES
-        value: "all"
-      - name: NVIDIA_DRIVER_CAPABILITIES
-        value: "compute,utility"
-    """)
+class _RoleSizing(NamedTuple):
+    port: int
+    gpus: int      # per pod = TP × PP
+    replicas: int  # pods = DP
 
-# ------------------------------
-# Monolith renderer (legacy path)
-# ------------------------------
-def render_manifests_monolith(
-    spec,
-    namespace: str = "llmserve",
-    image: str | None = None,
-    svc_type: str = "LoadBalancer",
-) -> dict[str, str]:
-    image = image or os.environ.get("LLMSERVE_IMAGE", "ghcr.io/yourorg/llmserve:0.1.0")
-    router_port = int(getattr(spec.deployment, "router_port", 8000))
-    metrics_port = 9400
-    replicas = int(spec.deployment.replicas.get("decode", 1))
 
-    ns = _yaml(f"""
-    apiVersion: v1
-    kind: Namespace
-    metadata:
-      name: {namespace}
-      labels:
-        app.kubernetes.io/name: llmserve
-        app.kubernetes.io/part-of: llmserve
-    """)
+def _role_sizing(rcfg, port: int) -> _RoleSizing:
+    # fields are validated ints (RoleParallelismCfg); no coercion needed
+    return _RoleSizing(port, max(1, rcfg.tp * rcfg.pp), max(1, rcfg.dp))
+
+
+@dataclass(frozen=True, slots=True)
+class _DeployView:
+    # spec.deployment/spec.roles projected once per render instead of re-walked per field
+    router_port: int
+    replicas: dict[str, int]
+    prefill: _RoleSizing
+    decode: _RoleSizing
+    metrics_port: int = 9400
 
-    cm_header = f"""
-    apiVersion: v1
-    kind: ConfigMap
-    metadata:
-      name: llmserve-manifest
-      namespace: {namespace}
-    data:
-      llmserve.yaml: |
-    """
 
-    dep = _yaml(f"""
+def _deploy_view(spec) -> _DeployView:
+    d, roles = spec.deployment, spec.roles
+    return _DeployView(
+        router_port=d.router_port,
+        replicas=d.replicas,
+        prefill=_role_sizing(roles.prefill, d.prefill_port),
+        decode=_role_sizing(roles.decode, d.decode_port),
+    )
+
+
+# Deployment/Service skeletons: dedented once at import, filled via str.format.
+# Fragment slots ({tolerations}, {env_from}, ...) sit at column 0 and receive
+# pre-indented helper output.
+_MONO_DEP_TPL = _yaml("""
     apiVersion: apps/v1
     kind: Deployment
     metadata:
@@ -87,15 +77,9 @@ def render_manifests_monolith(
           labels:
             app.kubernetes.io/name: llmserve
             app.kubernetes.io/component: api
-          annotations:
-            prometheus.io/scrape: "true"
-            prometheus.io/port: "{metrics_port}"
-            prometheus.io/path: "/metrics"
+    {annotations}
         spec:
-          tolerations:
-            - key: "nvidia.com/gpu"
-              operator: "Exists"
-              effect: "NoSchedule"
+    {tolerations}
           containers:
             - name: llmserve
               image: {image}
@@ -106,13 +90,8 @@ def render_manifests_monolith(
                   containerPort: {router_port}
                 - name: metrics
                   containerPort: {metrics_port}
-{_env_block().rstrip()}
-              volumeMounts:
-                - name: cfg
-                  mountPath: /app/llmserve.yaml
-                  subPath: llmserve.yaml
-                - name: kvpages
-                  mountPath: /var/lib/kvpages
+    {env_from}
+    {volume_mounts}
               resources:
                 requests:
                   cpu: "2000m"
@@ -134,18 +113,12 @@ def render_manifests_monolith(
                   port: http
                 initialDelaySeconds: 30
                 periodSeconds: 10
-          volumes:
-            - name: cfg
-              configMap:
-                name: llmserve-manifest
-            - name: kvpages
-              persistentVolumeClaim:
-                claimName: kvpages-pvc
+    {pod_volumes}
           nodeSelector:
             kubernetes.io/arch: amd64
     """)
 
-    svc = _yaml(f"""
+_MONO_SVC_TPL = _yaml("""
     apiVersion: v1
     kind: Service
     metadata:
@@ -167,88 +140,7 @@ def render_manifests_monolith(
           targetPort: metrics
     """)
 
-    pvc = _yaml(f"""
-    apiVersion: v1
-    kind: PersistentVolumeClaim
-    metadata:
-      name: kvpages-pvc
-      namespace: {namespace}
-    spec:
-      accessModes: ["ReadWriteOnce"]
-      resources:
-        requests:
-          storage: 500Gi
-      storageClassName: fast-nvme
-    """)
-
-    sc = _yaml(f"""
-    apiVersion: storage.k8s.io/v1
-    kind: StorageClass
-    metadata:
-      name: fast-nvme
-    provisioner: kubernetes.io/no-provisioner
-    volumeBindingMode: WaitForFirstConsumer
-    reclaimPolicy: Delete
-    """)
-
-    return {
-        "00-namespace.yaml": ns,
-        "01-configmap-manifest.yaml": cm_header,
-        "10-deployment.yaml": dep,
-        "20-service.yaml": svc,
-        "50-kvpages-pvc.yaml": pvc,
-        "51-storageclass-fast-nvme.yaml": sc,
-    }
-
-# ------------------------------------------
-# Disaggregated renderer (router/prefill/decode)
-# GPU sizing: per-pod GPUs = TP × PP ; replicas = DP
-# ------------------------------------------
-def render_manifests_disagg(
-    spec,
-    namespace: str = "llmserve",
-    image: str | None = None,
-    svc_type: str = "LoadBalancer",
-) -> dict[str, str]:
-    image = image or os.environ.get("LLMSERVE_IMAGE", "ghcr.io/yourorg/llmserve:0.1.0")
-
-    # Ports
-    router_port = int(getattr(spec.deployment, "router_port", 8000))
-    prefill_port = int(getattr(spec.deployment, "prefill_port", 9001))
-    decode_port  = int(getattr(spec.deployment, "decode_port", 9002))
-    metrics_port = 9400
-
-    # GPU math from roles: GPUs per pod = TP × PP
-    prefill_gpus = max(1, int(spec.roles.prefill.tp) * int(spec.roles.prefill.pp))
-    decode_gpus  = max(1, int(spec.roles.decode.tp)  * int(spec.roles.decode.pp))
-
-    # DP via replicas (pods)
-    prefill_repl = max(1, int(spec.roles.prefill.dp_replicas))
-    decode_repl  = max(1, int(spec.roles.decode.dp_replicas))
-    router_repl  = max(1, int(spec.deployment.replicas.get("router", 1)))
-
-    ns = _yaml(f"""
-    apiVersion: v1
-    kind: Namespace
-    metadata:
-      name: {namespace}
-      labels:
-        app.kubernetes.io/name: llmserve
-        app.kubernetes.io/part-of: llmserve
-    """)
-
-    cm_header = f"""
-    apiVersion: v1
-    kind: ConfigMap
-    metadata:
-      name: llmserve-manifest
-      namespace: {namespace}
-    data:
-      llmserve.yaml: |
-    """
-
-    # Router (HTTP API)
-    router_dep = _yaml(f"""
+_ROUTER_DEP_TPL = _yaml("""
     apiVersion: apps/v1
     kind: Deployment
     metadata:
@@ -269,10 +161,7 @@ def render_manifests_disagg(
           labels:
             app.kubernetes.io/name: llmserve
             app.kubernetes.io/component: router
-          annotations:
-            prometheus.io/scrape: "true"
-            prometheus.io/port: "{metrics_port}"
-            prometheus.io/path: "/metrics"
+    {annotations}
         spec:
           containers:
             - name: router
@@ -287,10 +176,7 @@ def render_manifests_disagg(
                   containerPort: {router_port}
                 - name: metrics
                   containerPort: {metrics_port}
-              volumeMounts:
-                - name: cfg
-                  mountPath: /app/llmserve.yaml
-                  subPath: llmserve.yaml
+    {volume_mounts}
               resources:
                 requests:
                   cpu: "1000m"
@@ -298,13 +184,10 @@ def render_manifests_disagg(
                 limits:
                   cpu: "2000m"
                   memory: "4Gi"
-          volumes:
-            - name: cfg
-              configMap:
-                name: llmserve-manifest
+    {pod_volumes}
     """)
 
-    router_svc = _yaml(f"""
+_ROUTER_SVC_TPL = _yaml("""
     apiVersion: v1
     kind: Service
     metadata:
@@ -327,250 +210,386 @@ def render_manifests_disagg(
           targetPort: metrics
     """)
 
-    # Prefill worker (gRPC)
-    prefill_dep = _yaml(f"""
+# prefill/decode share one skeleton; per-role values go through _render_role_deploy
+_ROLE_DEP_TPL = _yaml("""
     apiVersion: apps/v1
     kind: Deployment
     metadata:
-      name: llmserve-prefill
+      name: llmserve-{role}
       namespace: {namespace}
       labels:
         app.kubernetes.io/name: llmserve
-        app.kubernetes.io/component: prefill
+        app.kubernetes.io/component: {role}
     spec:
-      replicas: {prefill_repl}
+      replicas: {replicas}
       revisionHistoryLimit: 2
       selector:
         matchLabels:
           app.kubernetes.io/name: llmserve
-          app.kubernetes.io/component: prefill
+          app.kubernetes.io/component: {role}
       template:
         metadata:
           labels:
             app.kubernetes.io/name: llmserve
-            app.kubernetes.io/component: prefill
-          annotations:
-            prometheus.io/scrape: "true"
-            prometheus.io/port: "{metrics_port}"
-            prometheus.io/path: "/metrics"
+            app.kubernetes.io/component: {role}
+    {annotations}
         spec:
-          tolerations:
-            - key: "nvidia.com/gpu"
-              operator: "Exists"
-              effect: "NoSchedule"
-          # Optional: steer prefill to specific nodes
+    {tolerations}
+          # Optional: steer {role} to {node_hint}
           # nodeSelector:
-          #   role: prefill
+          #   role: {role}
           containers:
-            - name: prefill
+            - name: {role}
               image: {image}
               imagePullPolicy: IfNotPresent
               env:
                 - name: ROLE
-                  value: "prefill"
-{_env_block().rstrip()}
+                  value: "{role}"
+    {env_from}
               args: ["llmserve","up","-f","/app/llmserve.yaml"]
               ports:
                 - name: grpc
-                  containerPort: {prefill_port}
+                  containerPort: {port}
                 - name: metrics
                   containerPort: {metrics_port}
-              volumeMounts:
-                - name: cfg
-                  mountPath: /app/llmserve.yaml
-                  subPath: llmserve.yaml
-                - name: kvpages
-                  mountPath: /var/lib/kvpages
+    {volume_mounts}
               resources:
                 requests:
                   cpu: "2000m"
                   memory: "12Gi"
-                  "nvidia.com/gpu": "{prefill_gpus}"
+                  "nvidia.com/gpu": "{gpus}"
                 limits:
                   cpu: "4000m"
                   memory: "24Gi"
-                  "nvidia.com/gpu": "{prefill_gpus}"
-          volumes:
-            - name: cfg
-              configMap:
-                name: llmserve-manifest
-            - name: kvpages
-              persistentVolumeClaim:
-                claimName: kvpages-pvc
+                  "nvidia.com/gpu": "{gpus}"
+    {pod_volumes}
     """)
 
-    prefill_svc = _yaml(f"""
+_ROLE_SVC_TPL = _yaml("""
     apiVersion: v1
     kind: Service
     metadata:
-      name: llmserve-prefill
+      name: llmserve-{role}
       namespace: {namespace}
       labels:
         app.kubernetes.io/name: llmserve
-        app.kubernetes.io/component: prefill
+        app.kubernetes.io/component: {role}
     spec:
       type: ClusterIP
       selector:
         app.kubernetes.io/name: llmserve
-        app.kubernetes.io/component: prefill
+        app.kubernetes.io/component: {role}
       ports:
         - name: grpc
-          port: {prefill_port}
+          port: {port}
           targetPort: grpc
     """)
 
-    # Decode worker (gRPC)
-    decode_dep = _yaml(f"""
-    apiVersion: apps/v1
-    kind: Deployment
-    metadata:
-      name: llmserve-decode
-      namespace: {namespace}
-      labels:
-        app.kubernetes.io/name: llmserve
-        app.kubernetes.io/component: decode
-    spec:
-      replicas: {decode_repl}
-      revisionHistoryLimit: 2
-      selector:
-        matchLabels:
-          app.kubernetes.io/name: llmserve
-          app.kubernetes.io/component: decode
-      template:
-        metadata:
-          labels:
-            app.kubernetes.io/name: llmserve
-            app.kubernetes.io/component: decode
-          annotations:
-            prometheus.io/scrape: "true"
-            prometheus.io/port: "{metrics_port}"
-            prometheus.io/path: "/metrics"
-        spec:
-          tolerations:
-            - key: "nvidia.com/gpu"
-              operator: "Exists"
-              effect: "NoSchedule"
-          # Optional: steer decode to nodes with fast NVMe
-          # nodeSelector:
-          #   role: decode
-          containers:
-            - name: decode
-              image: {image}
-              imagePullPolicy: IfNotPresent
-              env:
-                - name: ROLE
-                  value: "decode"
-{_env_block().rstrip()}
-              args: ["llmserve","up","-f","/app/llmserve.yaml"]
-              ports:
-                - name: grpc
-                  containerPort: {decode_port}
-                - name: metrics
-                  containerPort: {metrics_port}
-              volumeMounts:
-                - name: cfg
-                  mountPath: /app/llmserve.yaml
-                  subPath: llmserve.yaml
-                - name: kvpages
-                  mountPath: /var/lib/kvpages
-              resources:
-                requests:
-                  cpu: "2000m"
-                  memory: "12Gi"
-                  "nvidia.com/gpu": "{decode_gpus}"
-                limits:
-                  cpu: "4000m"
-                  memory: "24Gi"
-                  "nvidia.com/gpu": "{decode_gpus}"
-          volumes:
-            - name: cfg
-              configMap:
-                name: llmserve-manifest
-            - name: kvpages
-              persistentVolumeClaim:
-                claimName: kvpages-pvc
-    """)
+@functools.lru_cache(maxsize=None)
+def _pod_slots(kvpages: bool, metrics_port: int) -> dict[str, str]:
+    # fragment slots pre-indented to their template column; identical for every
+    # role and render, so built once per (kvpages, metrics_port) variant
+    return {
+        "annotations": _indent(_prom_annotations(metrics_port), 6).rstrip(),
+        "tolerations": _indent(_tolerations_yaml(), 6).rstrip(),
+        "env_from": _indent(_env_from(), 10).rstrip(),
+        "volume_mounts": _indent(_add_cfg_volume_mounts(kvpages), 10).rstrip(),
+        "pod_volumes": _indent(_add_pod_volumes(kvpages), 6).rstrip(),
+    }
 
-    decode_svc = _yaml(f"""
-    apiVersion: v1
-    kind: Service
-    metadata:
-      name: llmserve-decode
-      namespace: {namespace}
-      labels:
-        app.kubernetes.io/name: llmserve
-        app.kubernetes.io/component: decode
-    spec:
-      type: ClusterIP
-      selector:
-        app.kubernetes.io/name: llmserve
-        app.kubernetes.io/component: decode
-      ports:
-        - name: grpc
-          port: {decode_port}
-          targetPort: grpc
-    """)
 
-    pvc = _yaml(f"""
-    apiVersion: v1
-    kind: PersistentVolumeClaim
-    metadata:
-      name: kvpages-pvc
-      namespace: {namespace}
-    spec:
-      accessModes: ["ReadWriteOnce"]
-      resources:
-        requests:
-          storage: 500Gi
-      storageClassName: fast-nvme
-    """)
+_NODE_HINT = {"prefill": "specific nodes", "decode": "nodes with fast NVMe"}
 
-    sc = _yaml(f"""
-    apiVersion: storage.k8s.io/v1
-    kind: StorageClass
-    metadata:
-      name: fast-nvme
-    provisioner: kubernetes.io/no-provisioner
-    volumeBindingMode: WaitForFirstConsumer
-    reclaimPolicy: Delete
-    """)
 
-    return {
-        "00-namespace.yaml": ns,
-        "01-configmap-manifest.yaml": cm_header,
-        "10-router-deploy.yaml": router_dep,
-        "11-router-svc.yaml": router_svc,
-        "20-prefill-deploy.yaml": prefill_dep,
-        "21-prefill-svc.yaml": prefill_svc,
-        "30-decode-deploy.yaml": decode_dep,
-        "31-decode-svc.yaml": decode_svc,
-        "50-kvpages-pvc.yaml": pvc,
-        "51-storageclass-fast-nvme.yaml": sc,
-    }
+def _render_role_deploy(
+    role: str, namespace: str, image: str, port: int, gpus: int, replicas: int, metrics_port: int,
+) -> tuple[str, str]:
+    # one context dict feeds both templates; format_map skips kwargs unpacking
+    ctx = dict(
+        _pod_slots(True, metrics_port),
+        role=role,
+        namespace=namespace,
+        replicas=replicas,
+        metrics_port=metrics_port,
+        node_hint=_NODE_HINT[role],
+        image=image,
+        port=port,
+        gpus=gpus,
+    )
+    return _ROLE_DEP_TPL.format_map(ctx), _ROLE_SVC_TPL.format_map(ctx)
+
+# ------------------------------
+# Monolith renderer (legacy path)
+# ------------------------------
+def _iter_monolith(spec, namespace, image, svc_type, roles=None, cluster_scoped=True) -> Iterator[tuple[str, str]]:
+    # roles: accepted for a uniform renderer signature; the monolith is one pod
+    image = image or os.environ.get("LLMSERVE_IMAGE", "ghcr.io/yourorg/llmserve:0.1.0")
+    dv = _deploy_view(spec)
+    router_port, metrics_port = dv.router_port, dv.metrics_port
+    replicas = dv.replicas.get("decode", 1)
+
+    if cluster_scoped: yield "00-namespace.yaml", _ns(namespace)
+    yield "01-configmap-manifest.yaml", _cm_header(namespace)
+    yield "02-configmap-env.yaml", _env_cm(namespace)
+    ctx = dict(
+        _pod_slots(True, metrics_port),
+        namespace=namespace,
+        replicas=replicas,
+        metrics_port=metrics_port,
+        image=image,
+        router_port=router_port,
+        svc_type=svc_type,
+    )
+    yield "10-deployment.yaml", _MONO_DEP_TPL.format_map(ctx)
+    yield "20-service.yaml", _MONO_SVC_TPL.format_map(ctx)
+    yield "50-kvpages-pvc.yaml", _pvc(namespace)
+    if cluster_scoped: yield "51-storageclass-fast-nvme.yaml", _sc()
+
+
+def render_manifests_monolith(
+    spec,
+    namespace: str = "llmserve",
+    image: str | None = None,
+    svc_type: str = "LoadBalancer",
+    emit_cluster_scoped: bool = True,
+) -> dict[str, str]:
+    return dict(_iter_monolith(spec, namespace, image, svc_type, None, emit_cluster_scoped))
+
+# ------------------------------------------
+# Disaggregated renderer (router/prefill/decode)
+# GPU sizing: per-pod GPUs = TP × PP ; replicas = DP
+# ------------------------------------------
+def _iter_disagg(spec, namespace, image, svc_type, roles=None, cluster_scoped=True) -> Iterator[tuple[str, str]]:
+    # roles: subset of {"router","prefill","decode"} to render (None = all);
+    # ConfigMap is always emitted, PVC/SC only with a GPU worker role.
+    # cluster_scoped=False drops Namespace/StorageClass (shared, rarely change)
+    image = image or os.environ.get("LLMSERVE_IMAGE", "ghcr.io/yourorg/llmserve:0.1.0")
+    want = roles.__contains__ if roles is not None else (lambda _r: True)
+
+    # Ports
+    dv = _deploy_view(spec)
+    metrics_port = dv.metrics_port
+
+    if cluster_scoped: yield "00-namespace.yaml", _ns(namespace)
+    yield "01-configmap-manifest.yaml", _cm_header(namespace)
+    if want("prefill") or want("decode"):
+        yield "02-configmap-env.yaml", _env_cm(namespace)
+
+    # Router (HTTP API)
+    if want("router"):
+        router_repl = max(1, dv.replicas.get("router", 1))
+        ctx = dict(
+            _pod_slots(False, metrics_port),
+            namespace=namespace,
+            router_repl=router_repl,
+            metrics_port=metrics_port,
+            image=image,
+            router_port=dv.router_port,
+            svc_type=svc_type,
+        )
+        yield "10-router-deploy.yaml", _ROUTER_DEP_TPL.format_map(ctx)
+        yield "11-router-svc.yaml", _ROUTER_SVC_TPL.format_map(ctx)
+
+    # Prefill / decode workers (gRPC)
+    workers = False
+    for role, rs, idx in (("prefill", dv.prefill, 2), ("decode", dv.decode, 3)):
+        if not want(role): continue
+        dep, svc = _render_role_deploy(role, namespace, image, rs.port, rs.gpus, rs.replicas, metrics_port)
+        yield f"{idx}0-{role}-deploy.yaml", dep
+        yield f"{idx}1-{role}-svc.yaml", svc
+        workers = True
+
+    if workers:
+        yield "50-kvpages-pvc.yaml", _pvc(namespace)
+        if cluster_scoped: yield "51-storageclass-fast-nvme.yaml", _sc()
+
+
+def render_manifests_disagg(
+    spec,
+    namespace: str = "llmserve",
+    image: str | None = None,
+    svc_type: str = "LoadBalancer",
+    roles: set[str] | None = None,
+    emit_cluster_scoped: bool = True,
+) -> dict[str, str]:
+    return dict(_iter_disagg(spec, namespace, image, svc_type, roles, emit_cluster_scoped))
 
 # ------------------------------
 # Switch: pick renderer by spec
 # ------------------------------
+# rendered doc sets keyed by a digest of (spec, render args); repeated renders
+# of an unchanged spec in one process become a dict lookup. Small LRU: a
+# long-lived process rendering many specs must not grow without bound.
+_RENDER_CACHE: OrderedDict[bytes, dict[str, str]] = OrderedDict()
+_RENDER_CACHE_MAX = 32
+
+# spec.deployment.disaggregated -> doc generator; all share one signature
+_RENDERERS = {False: _iter_monolith, True: _iter_disagg}
+
+
+def _render_key(spec, namespace, image, svc_type, roles, cluster_scoped) -> bytes | None:
+    dump = getattr(spec, "model_dump_json", None)
+    if dump is None: return None
+    h = hashlib.blake2b(dump().encode("utf-8"), digest_size=16)
+    h.update("\x1f".join((
+        namespace, image or os.environ.get("LLMSERVE_IMAGE", ""), svc_type,
+        ",".join(sorted(roles)) if roles is not None else "*",
+        "cs" if cluster_scoped else "",
+    )).encode("utf-8"))
+    return h.digest()
+
+
+def _disk_path(key: bytes) -> Path | None:
+    # opt-in: a shared cache dir is a content-injection vector, so only when asked
+    if os.environ.get("LLMSERVE_RENDER_CACHE") != "1": return None
+    root = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    # versioned dir: template changes between releases never hit stale entries
+    return Path(root) / "llmserve" / "render" / __version__ / f"{key.hex()}.json"
+
+
+def _remember(key: bytes, docs: dict[str, str]) -> None:
+    _RENDER_CACHE[key] = docs
+    _RENDER_CACHE.move_to_end(key)
+    while len(_RENDER_CACHE) > _RENDER_CACHE_MAX:
+        _RENDER_CACHE.popitem(last=False)
+
+
+def _cached_docs(key: bytes | None) -> dict[str, str] | None:
+    if key is None: return None
+    docs = _RENDER_CACHE.get(key)
+    if docs is not None:
+        _RENDER_CACHE.move_to_end(key)
+        return docs
+    p = _disk_path(key)
+    if p is None: return None
+    try:
+        docs = json.loads(p.read_bytes())
+    except (OSError, ValueError):
+        return None
+    if not isinstance(docs, dict) or not all(isinstance(v, str) for v in docs.values()):
+        return None
+    _remember(key, docs)
+    return docs
+
+
+def _store_docs(key: bytes | None, docs: dict[str, str]) -> None:
+    if key is None: return
+    _remember(key, dict(docs))
+    p = _disk_path(key)
+    if p is None: return
+    try:
+        p.parent.mkdir(parents=True, exist_ok=True)
+        tmp = p.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_bytes(json.dumps(docs).encode("utf-8"))
+        os.replace(tmp, p)
+    except OSError:
+        pass  # cache is best-effort
+
+
 def render_all(
     spec,
     namespace: str = "llmserve",
     image: str | None = None,
     svc_type: str = "LoadBalancer",
+    roles: set[str] | None = None,
+    emit_cluster_scoped: bool = True,
 ) -> dict[str, str]:
-    if getattr(spec.deployment, "disaggregated", False):
-        return render_manifests_disagg(spec, namespace=namespace, image=image, svc_type=svc_type)
-    return render_manifests_monolith(spec, namespace=namespace, image=image, svc_type=svc_type)
+    key = _render_key(spec, namespace, image, svc_type, roles, emit_cluster_scoped)
+    cached = _cached_docs(key)
+    if cached is not None: return dict(cached)
+    render = _RENDERERS[bool(spec.deployment.disaggregated)]
+    docs = dict(render(spec, namespace, image, svc_type, roles, emit_cluster_scoped))
+    _store_docs(key, docs)
+    return docs
+
+render_all.cache_clear = _RENDER_CACHE.clear
+
+
+def render_all_iter(
+    spec,
+    namespace: str = "llmserve",
+    image: str | None = None,
+    svc_type: str = "LoadBalancer",
+    roles: set[str] | None = None,
+    emit_cluster_scoped: bool = True,
+) -> Iterator[tuple[str, str]]:
+    # streaming variant: yields (filename, yaml) as each doc is built so
+    # write_out can persist it before the next one exists; only fills the cache
+    # when the on-disk cache is enabled (the result must then be kept whole)
+    key = _render_key(spec, namespace, image, svc_type, roles, emit_cluster_scoped)
+    cached = _cached_docs(key)
+    if cached is not None:
+        yield from cached.items(); return
+    render = _RENDERERS[bool(spec.deployment.disaggregated)]
+    it = render(spec, namespace, image, svc_type, roles, emit_cluster_scoped)
+    if key is not None and _disk_path(key) is not None:
+        docs = dict(it)
+        _store_docs(key, docs)
+        yield from docs.items()
+    else:
+        yield from it
 
 # ------------------------------
 # Writer: dump YAMLs to dir and inject manifest content
 # ------------------------------
-def write_out(dirpath: str, docs: dict[str, str], manifest_text: str) -> Path:
+_CM_PAD = b" " * 8  # llmserve.yaml block-scalar column inside the ConfigMap
+
+def _payloads(
+    docs: dict[str, str] | Iterable[tuple[str, str]], manifest_text: str
+) -> Iterator[tuple[str, bytes]]:
+    # ConfigMap body: encode once, indent with a single bytes.replace pass
+    mb = manifest_text.encode("utf-8")
+    manifest_block = _CM_PAD + mb.replace(b"\n", b"\n" + _CM_PAD) if mb else b""
+    if manifest_block.endswith(b"\n" + _CM_PAD): manifest_block = manifest_block[:-len(_CM_PAD)]
+    # lazy: with render_all_iter each doc is encoded/written as it is produced
+    for name, text in (docs.items() if isinstance(docs, dict) else docs):
+        data = text.encode("utf-8")
+        yield name, data + manifest_block if name.endswith("configmap-manifest.yaml") else data
+
+
+def write_stream(
+    out: BinaryIO,
+    docs: dict[str, str] | Iterable[tuple[str, str]],
+    manifest_text: str,
+) -> None:
+    """Write every doc to one multi-document YAML stream (e.g. `kubectl apply -f -`)."""
+    sep = b""
+    for _, data in _payloads(docs, manifest_text):
+        out.write(sep)
+        out.write(data)
+        sep = b"---\n" if data.endswith(b"\n") else b"\n---\n"
+
+
+_WRITE_WINDOW = 8
+
+
+def write_out(
+    dirpath: str,
+    docs: dict[str, str] | Iterable[tuple[str, str]],
+    manifest_text: str,
+    bundle: bool = False,
+) -> Path:
     outdir = Path(dirpath)
     outdir.mkdir(parents=True, exist_ok=True)
-    for name, text in docs.items():
-        p = outdir / name
-        if name.endswith("configmap-manifest.yaml"):
-            indented = "".join(f"        {line}" for line in manifest_text.splitlines(True))
-            text = text + indented
-        p.write_text(text, encoding="utf-8")
+    payloads = ((outdir / name, data) for name, data in _payloads(docs, manifest_text))
+    if bundle:
+        # one archive instead of one inode per doc; returns the tar path
+        tar_path = outdir / "manifests.tar"
+        with tarfile.open(tar_path, "w") as tar:
+            for path, data in payloads:
+                info = tarfile.TarInfo(path.name)
+                info.size = len(data)
+                tar.addfile(info, io.BytesIO(data))
+        return tar_path
+    # writes release the GIL; fan out so slow/network filesystems don't
+    # serialize, but keep at most _WRITE_WINDOW payloads in flight so the
+    # docs stream is consumed as it is written (Executor.map submits all)
+    pending: deque = deque()
+    with ThreadPoolExecutor(max_workers=_WRITE_WINDOW) as ex:
+        for path, data in payloads:
+            if len(pending) >= _WRITE_WINDOW:
+                pending.popleft().result()
+            pending.append(ex.submit(path.write_bytes, data))
+        for f in pending:
+            f.result()
     return outdir
\ No newline at end of file
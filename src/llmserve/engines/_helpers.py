@@ -1,4 +1,7 @@
 from __future__ import annotations
+import functools, inspect, logging
+
+log = logging.getLogger(__name__)
 
 def resolve_tp_pp(spec, role: str) -> tuple[int, int]:
     # Prefer role-specific overrides; fall back to model defaults
@@ -8,4 +11,25 @@ def resolve_tp_pp(spec, role: str) -> tuple[int, int]:
     else:
         tp = max(1, int(spec.roles.decode.tp))
         pp = max(1, int(spec.roles.decode.pp))
-    return tp, pp
\ No newline at end of file
+    return tp, pp
+
+
+@functools.lru_cache(maxsize=None)
+def _arg_names(cls) -> frozenset[str] | None:
+    # EngineArgs fields differ across vLLM versions; resolve the accepted names
+    # once. None => it takes **kwargs and we cannot filter.
+    params = inspect.signature(cls).parameters
+    if any(p.kind is p.VAR_KEYWORD for p in params.values()):
+        return None
+    return frozenset(params)
+
+
+def filter_engine_kwargs(cls, kwargs: dict) -> dict:
+    names = _arg_names(cls)
+    if names is None:
+        return kwargs
+    dropped = kwargs.keys() - names
+    if not dropped:
+        return kwargs
+    log.debug("%s: dropping unsupported %s", cls.__name__, sorted(dropped))
+    return {k: v for k, v in kwargs.items() if k in names}
\ No newline at end of file
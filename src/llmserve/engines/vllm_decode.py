@@ -1,13 +1,17 @@
 # SPDX-License-Identifier: Apache-2.0
 from __future__ import annotations
-import logging, time, random
+import functools, itertools, logging, os, time
 from typing import AsyncGenerator, Protocol
-from ..metrics.prometheus import SPEC_ACCEPT, SPEC_SPEEDUP
+from ..metrics.prometheus import METRIC_TTFT, SPEC_ACCEPT, SPEC_SPEEDUP
 from ..util.plugin import load_symbol, PluginLoadError
-from ._helpers import resolve_tp_pp
+from ._helpers import filter_engine_kwargs, resolve_tp_pp
 
 log = logging.getLogger(__name__)
 
+# unlabeled histograms: bind observe once instead of resolving it per request
+_observe_accept = SPEC_ACCEPT.observe
+_observe_speedup = SPEC_SPEEDUP.observe
+
 try:
     from vllm.engine.arg_utils import EngineArgs
     from vllm.engine.async_llm_engine import AsyncLLMEngine
@@ -27,85 +31,109 @@ class DecodeStrategy(Protocol):
     async def stream_text(self, prompt: str, **kw) -> AsyncGenerator[str, None]: ...
 
 
+# request ids only need to be unique within this process's engine; a counter
+# avoids a urandom read + hex format per request
+_REQ_PREFIX = f"llms-{os.getpid()}-"
+_req_seq = itertools.count()
+
+
+@functools.lru_cache(maxsize=256)
+def _cached_sampling_params(max_tokens: int, temperature: float, top_p: float) -> SamplingParams:
+    # shared across requests with identical knobs; the engine clones params on add_request
+    return SamplingParams(max_tokens=max_tokens, temperature=temperature, top_p=top_p)
+
+
 def _build_engine_args(kwargs: dict) -> EngineArgs | None:
     if not VLLM_AVAILABLE:
         return None
-    while True:
-        try:
-            return EngineArgs(**kwargs)
-        except TypeError as te:
-            msg = str(te)
-            removed = False
-            for k in list(kwargs.keys()):
-                if f"'{k}'" in msg or (k + "=") in msg:
-                    kwargs.pop(k)
-                    removed = True
-                    break
-            if not removed:
-                raise
+    return EngineArgs(**filter_engine_kwargs(EngineArgs, kwargs))
 
 
 class _BaseVLLMStrategy:
-    def __init__(self, spec):
+    def __init__(self, spec, role: str = "decode", engine: AsyncLLMEngine | None = None):
         self.spec = spec
-        self.engine: AsyncLLMEngine | None = None
+        self.role = role
+        # spec is fixed after load; resolved once instead of per startup
+        self._model = spec.models["primary"]
+        self._tp, self._pp = resolve_tp_pp(spec, role)
+        # an injected engine is shared with other strategies (see HybridStrategy)
+        self.engine: AsyncLLMEngine | None = engine
+        # telemetry settings are fixed after load; resolve once for the hot path
+        tel = spec.telemetry
+        self._tel_enabled = bool(tel.speculative_metrics_enabled)
+        rate = float(tel.speculative_sample_rate)
+        # sample 1 in _tel_every requests (0 = never)
+        self._tel_every = 0 if rate <= 0.0 else max(1, round(1.0 / min(rate, 1.0)))
+        self._tel_n = 0
 
     async def _startup(self, extra_args: dict | None = None):
+        if self.engine is not None:
+            return
         if not VLLM_AVAILABLE:
             log.warning("Decode strategy in STUB mode (no vLLM)")
             return
-        m = self.spec.models["primary"]
-        tp, pp = resolve_tp_pp(self.spec, self.role)
+        m = self._model
+        pol = self.spec.scheduling.policies
 
         args_kwargs: dict = dict(
             model=m.id,
             dtype=m.dtype,
-            tensor_parallel_size=tp,
-            pipeline_parallel_size=pp,
+            tensor_parallel_size=self._tp,
+            pipeline_parallel_size=self._pp,
             enable_prefix_caching=self.spec.kv_cache.prefix_caching,
-            enforce_eager=self.spec.scheduling.policies.chunked_prefill,
-            gpu_memory_utilization=0.92,
+            enable_chunked_prefill=pol.chunked_prefill,
+            enforce_eager=False,  # keep CUDA graphs for decode
+            gpu_memory_utilization=pol.gpu_memory_utilization,
         )
+        if pol.max_num_batched_tokens:
+            args_kwargs["max_num_batched_tokens"] = pol.max_num_batched_tokens
+        if self.role == "decode" and pol.num_scheduler_steps:
+            # k decode steps per scheduler call; dropped by _build_engine_args on
+            # vLLM versions without the knob
+            args_kwargs["num_scheduler_steps"] = pol.num_scheduler_steps
         if extra_args:
             args_kwargs.update(extra_args)
         ea = _build_engine_args(args_kwargs)
         self.engine = AsyncLLMEngine.from_engine_args(ea) if ea else None
 
-    async def _telemetry_spec(self, outputs, start_ts: float):
+    async def _telemetry_spec(self, outputs, start_ns: int):
         """Best-effort speculative metrics (acceptance, speedup) if available + sampling."""
-        tel = self.spec.telemetry
-        if not tel.speculative_metrics_enabled:
-            return
-        if (
-            tel.speculative_sample_rate < 1.0
-            and random.random() > tel.speculative_sample_rate
-        ):
+        if not self._tel_enabled or not self._tel_every:
             return
+        if self._tel_every > 1:
+            # deterministic 1-in-N sampling; no RNG call per request
+            self._tel_n += 1
+            if self._tel_n % self._tel_every:
+                return
         try:
             o0 = outputs[0]
             metrics = getattr(o0, "metrics", None) or {}
             acc = metrics.get("spec_acceptance") or metrics.get("acceptance_rate")
             if acc is not None:
                 try:
-                    SPEC_ACCEPT.observe(float(acc))
+                    _observe_accept(float(acc))
                 except Exception:
                     pass
             # naive speedup estimate: baseline ~ duration; if speculative tokens present, scale
-            dur = max(1e-6, time.time() - start_ts)
+            dur = max(1, time.monotonic_ns() - start_ns) / 1e9
             base = dur  # without baseline, we can't do better; keep 1.0
-            SPEC_SPEEDUP.observe(base / dur if dur > 0 else 1.0)
+            _observe_speedup(base / dur)
         except Exception:
             pass
 
+    @staticmethod
+    def _sampling_params(kw: dict) -> SamplingParams:
+        return _cached_sampling_params(
+            int(kw.get("max_tokens", 256)),
+            float(kw.get("temperature", 0.7)),
+            float(kw.get("top_p", 0.95)),
+        )
+
     async def generate_text(self, prompt: str, **kw) -> str:
         if not VLLM_AVAILABLE or self.engine is None:
             return f"(stub) {prompt[:64]} ..."
-        sp = SamplingParams(
-            max_tokens=int(kw.get("max_tokens", 256)),
-            temperature=float(kw.get("temperature", 0.7)),
-            top_p=float(kw.get("top_p", 0.95)),
-        )
-        t0 = time.time()
+        sp = self._sampling_params(kw)
+        t0 = time.monotonic_ns()
         outs = await self.engine.generate(prompt, sp)
         await self._telemetry_spec(outs, t0)
         if not outs:
@@ -113,24 +141,36 @@ class _BaseVLLMStrategy:
         return outs[0].outputs[0].text
 
     async def stream_text(self, prompt: str, **kw) -> AsyncGenerator[str, None]:
-        text = await self.generate_text(prompt, **kw)
-        chunk = int(kw.get("stream_chunk", 64))
-        for i in range(0, len(text), chunk):
-            yield text[i : i + chunk]
+        if not VLLM_AVAILABLE or self.engine is None:
+            # STUB mode: no token stream, chunk the full text
+            text = await self.generate_text(prompt, **kw)
+            chunk = int(kw.get("stream_chunk", 64))
+            for i in range(0, len(text), chunk):
+                yield text[i : i + chunk]
+            return
+        # forward vLLM's incremental outputs as deltas so TTFT is first-token latency
+        sp = self._sampling_params(kw)
+        t0 = time.monotonic_ns()
+        prev = 0
+        last = None
+        async for out in self.engine.generate(prompt, sp, request_id=f"{_REQ_PREFIX}{next(_req_seq)}"):
+            last = out
+            text = out.outputs[0].text
+            if len(text) > prev:
+                if not prev:
+                    METRIC_TTFT.observe((time.monotonic_ns() - t0) / 1e9)
+                yield text[prev:]
+                prev = len(text)
+        if last is not None:
+            await self._telemetry_spec([last], t0)
 
 
 class BaselineStrategy(_BaseVLLMStrategy):
-    def __init__(self, spec, role="decode"):
-        super().__init__(spec, role)
-
     async def startup(self):
         await self._startup()
 
 
 class SpeculativeStrategy(_BaseVLLMStrategy):
-    def __init__(self, spec, role="decode"):
-        super().__init__(spec, role)
-
     async def startup(self):
         sd = self.spec.spec_decode
         extras: dict = {}
@@ -159,8 +199,8 @@ class SpeculativeStrategy(_BaseVLLMStrategy):
 
 
 class LookaheadStrategy(_BaseVLLMStrategy):
-    def __init__(self, spec, role="decode"):
-        super().__init__(spec, role)
+    def __init__(self, spec, role="decode", engine=None):
+        super().__init__(spec, role, engine)
         self.provider = None
         self.active = False
 
@@ -222,10 +262,15 @@ class HybridStrategy(_BaseVLLMStrategy):
         self.la = LookaheadStrategy(spec, role)
 
     async def startup(self):
-        # Always prepare vLLM paths first (fast path)
-        await self.vllm_baseline.startup()
-        await self.vllm_spec.startup()
-        # Prepare lookahead plugin too (may end up inactive)
+        # One AsyncLLMEngine for every path: start the vLLM path requests will
+        # actually use (speculative args iff spec_decode.enabled), then share
+        # its engine instead of loading the weights again per strategy
+        primary = self.vllm_spec if self.spec.spec_decode.enabled else self.vllm_baseline
+        await primary.startup()
+        self.engine = primary.engine
+        for s in (self.vllm_baseline, self.vllm_spec, self.la):
+            s.engine = self.engine
+        # Prepare lookahead plugin too (may end up inactive); attaches to the shared engine
         await self.la.startup()
 
     def _should_use_lookahead(
@@ -275,12 +320,12 @@ class HybridStrategy(_BaseVLLMStrategy):
         if self._should_use_lookahead(tenant, max_tokens, strategy_hint, workload):
             async for c in self.la.stream_text(prompt, **kw):
                 yield c
-                return
+            return
 
         if self.spec.spec_decode.enabled:
             async for c in self.vllm_spec.stream_text(prompt, **kw):
                 yield c
-                return
+            return
         async for c in self.vllm_baseline.stream_text(prompt, **kw):
             yield c
 
@@ -1,8 +1,9 @@
 # SPDX-License-Identifier: Apache-2.0
 from __future__ import annotations
+import asyncio
 import logging
 from dataclasses import dataclass
-from ._helpers import resolve_tp_pp
+from ._helpers import filter_engine_kwargs, resolve_tp_pp
 
 log = logging.getLogger(__name__)
 
@@ -35,28 +36,45 @@ class PrefillEngine:
     def __init__(self, spec, role: str = "prefill"):
         self.spec = spec
         self.role = role
+        self._model = spec.models["primary"]
+        self._tp, self._pp = resolve_tp_pp(spec, role)
         self.engine: AsyncLLMEngine | None = None
+        self._tokenizer = None
 
     async def startup(self):
         if not VLLM_AVAILABLE:
             log.warning("Starting PrefillEngine in STUB mode (no vLLM)")
             return
 
-        m = self.spec.models["primary"]
-        tp, pp = resolve_tp_pp(self.spec, self.role)
+        m = self._model
+        pol = self.spec.scheduling.policies
 
         args = dict(
             model=m.id,
             dtype=m.dtype,
-            tensor_parallel_size=tp,
-            pipeline_parallel_size=pp,
+            tensor_parallel_size=self._tp,
+            pipeline_parallel_size=self._pp,
             enable_prefix_caching=self.spec.kv_cache.prefix_caching,
-            enforce_eager=True,  # prefill benefits from eager kernels
-            gpu_memory_utilization=0.92,
+            enforce_eager=pol.prefill_eager,  # prefill benefits from eager kernels
+            gpu_memory_utilization=pol.gpu_memory_utilization,
         )
-        
-        ea = EngineArgs(**args)
+        if pol.max_num_batched_tokens:
+            args["max_num_batched_tokens"] = pol.max_num_batched_tokens
+        # long-context prefill: move weights (cpu_offload_gb) and preempted KV
+        # (swap_space) to host RAM so more HBM is left for the prompt's KV
+        kv = self.spec.kv_cache
+        if kv.prefill_cpu_offload_gb:
+            args["cpu_offload_gb"] = kv.prefill_cpu_offload_gb
+        if kv.prefill_swap_space_gib:
+            args["swap_space"] = kv.prefill_swap_space_gib
+
+        # knobs vary by vLLM version; drop what this EngineArgs does not accept
+        ea = EngineArgs(**filter_engine_kwargs(EngineArgs, args))
         self.engine = AsyncLLMEngine.from_engine_args(ea)
+        try:
+            self._tokenizer = self.engine.engine.tokenizer  # type: ignore[attr-defined]
+        except AttributeError:
+            log.warning("PrefillEngine: engine exposes no tokenizer; using length estimate")
         log.info("PrefillEngine ready: %s", m.id)
 
     async def prefill(self, prompt: str) -> PrefillResult:
@@ -70,13 +88,13 @@ class PrefillEngine:
             return PrefillResult(prompt_tokens=approx_tokens, kv_handle=None)
 
         # In future: call engine to perform a zero-decode prefill and capture KV.
-        # For now, we estimate using vLLM's tokenizer via dummy generation with max_tokens=0.
-        sp = SamplingParams(max_tokens=0, temperature=0.0)
-        _ = await self.engine.generate(prompt, sp)  # warms caches/tokenizer
-        # We don't get token count directly in this call; estimate by len(tokenizer)
+        # Until then only the token count is needed, so tokenize directly (off the
+        # event loop for long prompts) instead of booking a no-op engine step.
+        if self._tokenizer is None:
+            return PrefillResult(prompt_tokens=max(1, len(prompt) // 4), kv_handle=None)
         try:
-            tokenizer = self.engine.engine.tokenizer  # type: ignore[attr-defined]
-            prompt_tokens = len(tokenizer.encode(prompt))
+            ids = await asyncio.to_thread(self._tokenizer.encode, prompt)
+            prompt_tokens = len(ids)
         except Exception:
             prompt_tokens = max(1, len(prompt) // 4)
 
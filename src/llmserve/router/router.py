@@ -1,33 +1,60 @@
 # SPDX-License-Identifier: Apache-2.0
 from __future__ import annotations
-import asyncio, logging
+import asyncio, itertools, logging
+import grpc
 from typing import AsyncGenerator
 from ..engines.vllm_prefil import PrefillEngine
 from ..engines.vllm_decode import DecodeEngine
-from ..scheduler.fairshare import FairShareScheduler
+from ..scheduler.fairshare import DecodeError, FairShareScheduler
 from ..util.prefix_awarness import PrefixHeuristic
 from ..util.ratelimit import RateLimiter, RateLimitError, RateLimitRetry
 from ..rpc.client import RPCClient
 
 log = logging.getLogger(__name__)
 
+# same window PrefixHeuristic hashes: system prompt + first user turn
+_AFFINITY_CHARS = 512
+
 class _RouterCallbacks:
-    def __init__(self, decode_pool):
+    def __init__(self, decode_pool, prefix_affinity: bool = False, max_inflight: int = 0):
         self.decode_pool = decode_pool
-        self._rr_decode = 0
+        # pool is fixed once the router is built; cycle round-robins in C
+        self._rr_decode = itertools.cycle(range(len(decode_pool)))
+        self._affinity = prefix_affinity and len(decode_pool) > 1
+        # live streams per engine (decodes run concurrently, one task each).
+        # max_inflight is the scheduler-wide decode budget; an engine holding
+        # more than its even share spills affinity picks elsewhere. Without a
+        # budget (0) it spills once it runs over twice the least-loaded engine.
+        self._inflight = [0] * len(decode_pool)
+        n = len(decode_pool) or 1
+        self._max_inflight = -(-max_inflight // n) if max_inflight > 0 else 0
 
-    def _pick_decode(self) -> DecodeEngine:
-        eng = self.decode_pool[self._rr_decode % len(self.decode_pool)]
-        self._rr_decode += 1
-        return eng
+    def _pick_decode(self, ctx) -> int:
+        # prefix affinity: prompts sharing a prefix land on the same engine, so
+        # its prefix cache already holds that KV; distinct prefixes still spread
+        if self._affinity:
+            load = self._inflight
+            i = hash(ctx.prompt[:_AFFINITY_CHARS]) % len(load)
+            lo = min(range(len(load)), key=load.__getitem__)
+            if self._max_inflight:
+                if load[i] < self._max_inflight: return i
+            elif load[i] <= 2 * load[lo] + 1:
+                return i
+            # saturated: least-loaded engine rather than the next in rotation
+            return lo
+        return next(self._rr_decode)
 
     async def prefill_chunk(self, ctx, start_token: int, n_tokens: int):
         await asyncio.sleep(0)  # placeholder for real prefill
 
     async def decode_stream(self, ctx):
-        dec = self._pick_decode()
-        async for delta in dec.stream_text(ctx.prompt, **(ctx.opts or {})):
-            yield delta
+        i = self._pick_decode(ctx)
+        self._inflight[i] += 1
+        try:
+            async for delta in self.decode_pool[i].stream_text(ctx.prompt, **(ctx.opts or {})):
+                yield delta
+        finally:
+            self._inflight[i] -= 1
 
 class Router:
     def __init__(self, spec, prefill_pool: list[PrefillEngine], decode_pool: list[DecodeEngine]):
@@ -37,7 +64,10 @@ class Router:
         self.prefix = PrefixHeuristic()
         self.rate = RateLimiter(spec)
         self.scheduler = FairShareScheduler(spec, self.rate)
-        self._cb = _RouterCallbacks(decode_pool)
+        # no local engines (router role): decode over the gRPC workers
+        self._cb = _RouterCallbacks(
+            decode_pool, spec.scheduling.policies.decode_prefix_affinity, spec.budgets.max_decode_concurrency,
+        ) if decode_pool else _RemoteCallbacks(spec)
         self._task: asyncio.Task | None = None
 
     async def start(self):
@@ -45,7 +75,17 @@ class Router:
 
     async def stop(self):
         self.scheduler.stop()
-        if self._task: await asyncio.wait([self._task], timeout=2)
+        if self._task:
+            try:
+                # graceful exit first; wait_for cancels the scheduler if it overruns
+                await asyncio.wait_for(self._task, timeout=2)
+            except asyncio.TimeoutError:
+                pass
+            except asyncio.CancelledError:
+                # absorb only the scheduler task's own cancellation; a cancel
+                # aimed at us also cancels the awaited task, hence cancelling()
+                if asyncio.current_task().cancelling() or not self._task.cancelled(): raise
+            self._task = None
 
     async def submit_and_stream(self, prompt: str, tenant: str | None = None, opts: dict | None = None) -> AsyncGenerator[str, None]:
         tenant = tenant or "default"
@@ -66,31 +106,45 @@ class Router:
             opts=opts,
         )
 
+        # scheduler puts a None sentinel after the last delta (or on reject)
+        q = ctx.out_q
+        finished = False
         try:
-            while True:
-                if ctx.done.is_set() and ctx.out_q.empty(): break
-                delta = await ctx.out_q.get()
+            while (delta := await q.get()) is not None:
                 yield delta
+            finished = True
+            # decode-time reject or failed stream: never end it as if complete
+            if ctx.error is not None: raise ctx.error
         finally:
-            while not ctx.out_q.empty():
-                yield await ctx.out_q.get()
+            if not finished:
+                # client went away: stop the producer and free any put blocked on a full queue
+                ctx.cancelled = True
+                while not q.empty(): q.get_nowait()
 
     async def complete(self, prompt: str, tenant: str | None = None, opts: dict | None = None) -> str:
-        out = []
-        async for d in self.submit_and_stream(prompt, tenant=tenant, opts=opts or {}): out.append(d)
-        return "".join(out)
+        # str.join sizes the result once; the comprehension skips a bound append per delta
+        return "".join([d async for d in self.submit_and_stream(prompt, tenant=tenant, opts=opts or {})])
     
 class _RemoteCallbacks:
     def __init__(self, spec):
         self.spec = spec
         self.rpc = RPCClient(spec)
+        self._pd_threshold = spec.rpc.routing_threshold_tokens
 
     async def prefill_chunk(self, ctx, start_token: int, n_tokens: int):
+        # short prompts: PD transfer costs more than local prefill on the decode side
+        if ctx.est_tokens < self._pd_threshold: return
+        # the worker prefills the whole prompt on the first chunk; later chunks
+        # would only repeat that pass until KV handles carry per-chunk state
+        if start_token: return
         try:
             await self.rpc.prefill_chunk(ctx.req_id, ctx.prompt, start_token, n_tokens, ctx.tenant)
-        except Exception as e:
-            log.warning("prefill_chunk gRPC failed: %s", e)
-            await asyncio.sleep(0)
+        except grpc.aio.AioRpcError as e:
+            # worker-side failure: decode still prefills locally
+            log.warning("prefill_chunk gRPC failed: %s %s", e.code().name, e.details())
+        except Exception:
+            # never let one request take down the scheduler loop
+            log.exception("prefill_chunk failed for %s", ctx.req_id)
 
     async def decode_stream(self, ctx):
         try:
@@ -98,7 +152,7 @@ class _RemoteCallbacks:
             async for msg in stream:
                 # msg is DecodeChunk(delta=str)
                 yield msg.delta
-        except Exception as e:
-            log.warning("decode_stream gRPC failed: %s", e)
-            # fail fast with empty stream
-            return
\ No newline at end of file
+        except grpc.aio.AioRpcError as e:
+            # fail fast: the scheduler ends the client stream and the router raises this
+            raise DecodeError(f"{ctx.req_id}: {e.code().name} {e.details()}",
+                              timeout=e.code() == grpc.StatusCode.DEADLINE_EXCEEDED) from e
\ No newline at end of file
@@ -1,24 +1,62 @@
 # SPDX-License-Identifier: Apache-2.0
 from __future__ import annotations
-import json, grpc
+import asyncio, json, grpc
 from ...llmserve_pb2_grpc import PrefillServiceStub, DecodeServiceStub
 from ...llmserve_pb2 import PrefillChunkRequest, DecodeRequest
 
-def _channel(addr: str, round_robin: bool):
+# process-wide channels keyed by (loop, addr, round_robin, compression, slot):
+# Router instances created on reload/blue-green reuse the warm HTTP/2
+# connections; grpc.aio channels are bound to the loop that created them
+_CHANNELS: dict[tuple[asyncio.AbstractEventLoop | None, str, bool, grpc.Compression | None, int], grpc.aio.Channel] = {}
+
+def _loop() -> asyncio.AbstractEventLoop | None:
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+def _shared_channel(addr: str, round_robin: bool, compression: grpc.Compression | None = None,
+                    slot: int = 0) -> grpc.aio.Channel:
+    loop = _loop()
+    key = (loop, addr, round_robin, compression, slot)
+    ch = _CHANNELS.get(key)
+    if ch is None:
+        # channels of a loop that is gone can't be closed or used; just forget them
+        for k in [k for k in _CHANNELS if k[0] is not None and k[0].is_closed()]:
+            del _CHANNELS[k]
+        ch = _CHANNELS[key] = _channel(addr, round_robin, compression, own_connection=slot > 0)
+    return ch
+
+async def close_channels():
+    # app shutdown only (Orchestrator.stop); Router.stop leaves the shared
+    # channels open. Only this loop's channels: others can't be awaited here.
+    loop = _loop()
+    keys = [k for k in _CHANNELS if k[0] is loop]
+    chans = [_CHANNELS.pop(k) for k in keys]
+    for ch in chans:
+        await ch.close()
+
+def _channel(addr: str, round_robin: bool, compression: grpc.Compression | None = None,
+             own_connection: bool = False):
     # enable client-side round_robin (Python gRPC needs service_config)
     opts = [
+        # 8 MiB per-stream window: long prompts/streams don't stall on WINDOW_UPDATE
+        ("grpc.http2.lookahead_bytes", 8 * 1024 * 1024),
         ("grpc.keepalive_time_ms", 20000),
         ("grpc.keepalive_timeout_ms", 10000),
         ("grpc.http2.max_pings_without_data", 0),
         ("grpc.http2.min_time_between_pings_ms", 10000),
         ("grpc.enable_retries", 1),
     ]
+    if own_connection:
+        # channels with identical args share subchannels (one TCP conn) by default
+        opts.append(("grpc.use_local_subchannel_pool", 1))
     if round_robin:
         service_config = json.dumps({
             "loadBalancingConfig": [{"round_robin": {}}]
         })
         opts.append(("grpc.service_config", service_config))
-    return grpc.aio.insecure_channel(addr, options=opts)
+    return grpc.aio.insecure_channel(addr, options=opts, compression=compression)
 
 class RPCClient:
     def __init__(self, spec):
@@ -26,15 +64,23 @@ class RPCClient:
         self.prefill_addr = spec.rpc.prefill_service
         self.decode_addr = spec.rpc.decode_service
         self._rr = bool(spec.rpc.round_robin)
+        self._timeout = float(spec.rpc.timeout_s)
+        dt = spec.rpc.decode_timeout_s
+        self._decode_timeout = float(dt) if dt is not None else None
 
-        self._ch_prefill = _channel(self.prefill_addr, self._rr)
-        self._ch_decode  = _channel(self.decode_addr, self._rr)
-        self.prefill = PrefillServiceStub(self._ch_prefill)
-        self.decode  = DecodeServiceStub(self._ch_decode)
+        comp = grpc.Compression.Gzip if spec.rpc.compression == "gzip" else None
+        n = int(spec.rpc.channels_per_service)
+        self._prefill_stubs = [PrefillServiceStub(_shared_channel(self.prefill_addr, self._rr, comp, i)) for i in range(n)]
+        self._decode_stubs = [DecodeServiceStub(_shared_channel(self.decode_addr, self._rr, comp, i)) for i in range(n)]
+        self.prefill = self._prefill_stubs[0]
+        self.decode  = self._decode_stubs[0]
 
     async def prefill_chunk(self, req_id: str, prompt: str, start_token: int, n_tokens: int, tenant: str):
         req = PrefillChunkRequest(req_id=req_id, prompt=prompt, start_token=start_token, n_tokens=n_tokens, tenant=tenant)
-        return await self.prefill.PrefillChunk(req)
+        stubs = self._prefill_stubs
+        # sticky per request: all chunks of one prompt share a connection
+        stub = stubs[hash(req_id) % len(stubs)] if len(stubs) > 1 else self.prefill
+        return await stub.PrefillChunk(req, timeout=self._timeout)
 
     async def decode_stream(self, req_id: str, prompt: str, tenant: str, opts: dict):
         req = DecodeRequest(
@@ -45,4 +91,6 @@ class RPCClient:
             strategy_hint=(opts.get("strategy_hint") or "auto"),
             workload=(opts.get("workload") or "general"),
         )
-        return self.decode.DecodeStream(req)
\ No newline at end of file
+        stubs = self._decode_stubs
+        stub = stubs[hash(req_id) % len(stubs)] if len(stubs) > 1 else self.decode
+        return stub.DecodeStream(req, timeout=self._decode_timeout)
\ No newline at end of file
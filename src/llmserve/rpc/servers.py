@@ -4,6 +4,7 @@ import asyncio, logging, grpc
 from typing import AsyncIterator
 from ..engines.vllm_prefil import PrefillEngine
 from ..engines.vllm_decode import DecodeEngine
+from ..util.streams import prefetch_coalesced
 from ...llmserve_pb2 import (
     PrefillChunkRequest, PrefillChunkReply,
     DecodeRequest, DecodeChunk,
@@ -15,6 +16,10 @@ from ...llmserve_pb2_grpc import (
 
 log = logging.getLogger(__name__)
 
+# DecodeStream: deltas buffered ahead of the client, and max chars per coalesced frame
+_PREFETCH = 64
+_COALESCE_CHARS = 256
+
 class PrefillRPC(PrefillServiceServicer):
     def __init__(self, spec):
         self.spec = spec
@@ -53,17 +58,27 @@ class DecodeRPC(DecodeServiceServicer):
             "strategy_hint": request.strategy_hint or "auto",
             "workload": request.workload or "general",
         }
-        async for ch in self.engine.stream_text(request.prompt, **opts):
-            yield DecodeChunk(delta=ch)
+        # engine runs ahead into a bounded queue; whatever piled up while gRPC
+        # was flushing the last frame goes out as one DecodeChunk
+        deltas = prefetch_coalesced(self.engine.stream_text(request.prompt, **opts), _PREFETCH, _COALESCE_CHARS)
+        try:
+            async for delta in deltas:
+                yield DecodeChunk(delta=delta)
+        finally:
+            # client gone: stop the pump and aclose the engine stream now
+            await deltas.aclose()
+
+_SERVER_OPTS = [
+    ("grpc.keepalive_time_ms", 20000),
+    ("grpc.keepalive_timeout_ms", 10000),
+    ("grpc.http2.max_pings_without_data", 0),
+    ("grpc.http2.min_time_between_pings_ms", 10000),
+    ("grpc.max_receive_message_length", 64 * 1024 * 1024),
+    ("grpc.http2.lookahead_bytes", 8 * 1024 * 1024),
+]
 
 async def serve_prefill(spec, host: str, port: int):
-    server = grpc.aio.server(options=[
-        ("grpc.keepalive_time_ms", 20000),
-        ("grpc.keepalive_timeout_ms", 10000),
-        ("grpc.http2.max_pings_without_data", 0),
-        ("grpc.http2.min_time_between_pings_ms", 10000),
-        ("grpc.max_receive_message_length", 64 * 1024 * 1024),
-    ])
+    server = grpc.aio.server(options=_SERVER_OPTS)
     add_PrefillServiceServicer_to_server(PrefillRPC(spec), server)
     server.add_insecure_port(f"{host}:{port}")
     await server.start()
@@ -71,15 +86,21 @@ async def serve_prefill(spec, host: str, port: int):
     await server.wait_for_termination()
 
 async def serve_decode(spec, host: str, port: int):
-    server = grpc.aio.server(options=[
-        ("grpc.keepalive_time_ms", 20000),
-        ("grpc.keepalive_timeout_ms", 10000),
-        ("grpc.http2.max_pings_without_data", 0),
-        ("grpc.http2.min_time_between_pings_ms", 10000),
-        ("grpc.max_receive_message_length", 64 * 1024 * 1024),
-    ])
+    server = grpc.aio.server(options=_SERVER_OPTS)
     add_DecodeServiceServicer_to_server(DecodeRPC(spec), server)
     server.add_insecure_port(f"{host}:{port}")
     await server.start()
     log.info("Decode gRPC server on %s:%d", host, port)
+    await server.wait_for_termination()
+
+async def serve_combined(spec, host: str, prefill_port: int, decode_port: int):
+    # colocated prefill + decode: one aio server (one completion queue/poller)
+    # carries both services on their usual ports
+    server = grpc.aio.server(options=_SERVER_OPTS)
+    add_PrefillServiceServicer_to_server(PrefillRPC(spec), server)
+    add_DecodeServiceServicer_to_server(DecodeRPC(spec), server)
+    server.add_insecure_port(f"{host}:{prefill_port}")
+    server.add_insecure_port(f"{host}:{decode_port}")
+    await server.start()
+    log.info("Prefill+decode gRPC server on %s:%d/%d", host, prefill_port, decode_port)
     await server.wait_for_termination()
\ No newline at end of file
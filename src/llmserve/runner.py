@@ -2,13 +2,18 @@
 from __future__ import annotations
 import asyncio
 import logging
+import os
+# gRPC messages on the upb (C) protobuf backend; only takes effect before the
+# first protobuf import, and an explicit setting still wins
+os.environ.setdefault("PROTOCOL_BUFFERS_PYTHON_IMPLEMENTATION", "upb")
 import uvicorn
 from prometheus_client import start_http_server
 from .apiserver.http import build_app
 from .engines.vllm_prefil import PrefillEngine
 from .engines.vllm_decode import DecodeEngine
 from .router.router import Router
-from .rpc.servers import serve_prefill, serve_decode
+from .rpc.client import close_channels
+from .rpc.servers import serve_combined, serve_prefill, serve_decode
 
 log = logging.getLogger("llmserve")
 
@@ -20,6 +25,8 @@ class Orchestrator:
         self.router: Router | None = None
 
     async def _start_prefill_pool(self, n: int):
+        # sequential on purpose: vLLM engine construction is synchronous and
+        # every in-process replica loads onto the same visible GPUs
         for _ in range(max(1, n)):
             eng = PrefillEngine(self.spec)
             await eng.startup()
@@ -34,6 +41,8 @@ class Orchestrator:
         log.info("Decode pool size: %d", len(self.decode_pool))
 
     async def run_local(self, host: str = "0.0.0.0", port: int = 8000, metrics_port: int = 9400):
+        # The event loop is created by the CLI (uvloop when installed), so
+        # uvicorn serves on whatever loop is running; HTTP parsing uses httptools.
         # metrics
         start_http_server(metrics_port)
         log.info("metrics server on :%d", metrics_port)
@@ -52,13 +61,17 @@ class Orchestrator:
 
         # FastAPI
         app = build_app(self.spec, self.router)
-        config = uvicorn.Config(app=app, host=host, port=port, workers=1, loop="asyncio", lifespan="on")
+        config = uvicorn.Config(app=app, host=host, port=port, workers=1, loop="auto", http="httptools", lifespan="on")
         server = uvicorn.Server(config)
-        await server.serve()
+        try:
+            await server.serve()
+        finally:
+            await self.stop()
 
     async def stop(self):
         if self.router:
             await self.router.stop()
+        await close_channels()
         if self.prefill_pool:
             for eng in self.prefill_pool:
                 await eng.shutdown()
@@ -73,8 +86,11 @@ class Orchestrator:
         await self.router.start()
         app = build_app(self.spec, self.router)
         port = port or self.spec.deployment.router_port
-        config = uvicorn.Config(app=app, host=host, port=port, workers=1, loop="asyncio", lifespan="on")
-        await uvicorn.Server(config).serve()
+        config = uvicorn.Config(app=app, host=host, port=port, workers=1, loop="auto", http="httptools", lifespan="on")
+        try:
+            await uvicorn.Server(config).serve()
+        finally:
+            await self.stop()
 
     async def run_prefill_worker(self, host="0.0.0.0", port=None, metrics_port=9400):
         start_http_server(metrics_port)
@@ -82,4 +98,10 @@ class Orchestrator:
 
     async def run_decode_worker(self, host="0.0.0.0", port=None, metrics_port=9400):
         start_http_server(metrics_port)
-        await serve_decode(self.spec, host, port or self.spec.deployment.decode_port)
\ No newline at end of file
+        await serve_decode(self.spec, host, port or self.spec.deployment.decode_port)
+
+    async def run_workers(self, host="0.0.0.0", metrics_port=9400):
+        # prefill + decode colocated in one process (single-node / dev)
+        start_http_server(metrics_port)
+        d = self.spec.deployment
+        await serve_combined(self.spec, host, d.prefill_port, d.decode_port)
\ No newline at end of file
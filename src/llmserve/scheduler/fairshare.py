@@ -1,11 +1,18 @@
 # SPDX-License-Identifier: Apache-2.0
 from __future__ import annotations
-import time, heapq, asyncio, uuid
+import heapq, asyncio, contextlib, itertools, logging, uuid
 from dataclasses import dataclass, field
 from typing import Any
 from ..metrics.prometheus import Q_PREFILL, Q_DECODE, RATE_LIMIT_RETRY
+from ..util.ratelimit import RateLimitError, RateLimitRetry
 from ..util.types import monotonic_time
 
+log = logging.getLogger(__name__)
+
+class DecodeError(Exception):
+    """Decode stream failed part-way (engine/RPC); the output is truncated."""
+    def __init__(self, msg: str, timeout: bool = False): super().__init__(msg); self.timeout = timeout
+
 @dataclass(order=True)
 class _ScoredItem:
     score: float
@@ -14,6 +21,13 @@ class _ScoredItem:
     kind: str = field(compare=False)          # "prefill" | "decode"
     payload: Any = field(compare=False)
 
+# backoff before a rate-limited ("deprioritize") decode re-enters q_decode
+_RETRY_S = 0.01
+
+# per-request delta buffer; a reader this far behind backpressures its own
+# decode task only
+OUT_Q_MAX = 256
+
 @dataclass
 class RequestCtx:
     req_id: str
@@ -25,134 +39,213 @@ class RequestCtx:
     penalty_mult: float
     penalty_expires: float
     opts: dict 
-    # client pipes
-    out_q: asyncio.Queue[str]
+    # client pipes; None on out_q marks end of stream
+    out_q: asyncio.Queue[str | None]
     done: asyncio.Event
+    # set by the reader when the client goes away; producer stops putting
+    cancelled: bool = False
+    # why the stream ended early (RateLimitError / DecodeError); read after the sentinel
+    error: Exception | None = None
 
 class FairShareScheduler:
     def __init__(self, spec, rate_limiter):
         self.spec = spec
         self.rate = rate_limiter
+        # fixed after load: resolve weights/policies once, not per _score
+        tenants = spec.scheduling.fair_share.get("tenants", {})
+        self._weights = {t: float(c.get("weight", 1.0)) for t, c in tenants.items()}
+        self._inv_weights = {t: 1.0 / w for t, w in self._weights.items()}
+        self._pol = spec.scheduling.policies
+        # _score runs per enqueue; keep its policy inputs as plain floats/bools
+        self._prefix_aware = bool(self._pol.prefix_awareness)
+        aging = float(self._pol.aging_seconds)
+        self._inv_aging = 1.0 / aging if aging > 0 else 0.0
         self.arrival = 0
-        self.q: list[_ScoredItem] = []
+        # one heap per kind: depth gauges are len() and back-to-back decodes
+        # pop the decode heap directly instead of scanning + re-heapifying
+        self.q_prefill: list[_ScoredItem] = []
+        self.q_decode: list[_ScoredItem] = []
         self.reqs: dict[str, RequestCtx] = {}
+        # ids: random per-process prefix (router replicas share pid 1 in pods)
+        # + counter; one urandom read per scheduler instead of per submit
+        self._rid_prefix = uuid.uuid4().hex[:12] + "-"
+        self._rid_seq = itertools.count(1)
         self._stop = asyncio.Event()
+        # set by _enqueue_* (and stop) so an idle run loop parks instead of polling
+        self._ready = asyncio.Event()
+        # live decode streams, one task each (see _run_decode)
+        self._decode_tasks: set[asyncio.Task] = set()
+        # rate-limited decodes waiting to re-enter q_decode (see _requeue_decode)
+        self._waiters: set[asyncio.Task] = set()
 
     async def submit(self, tenant: str, prompt: str, est_tokens: int, prefix_hit_prob: float,
                      penalty_mult: float, penalty_expire: float, opts: dict) -> RequestCtx:
-        rid = str(uuid.uuid4())
+        rid = f"{self._rid_prefix}{next(self._rid_seq):x}"
         ctx = RequestCtx(
             req_id=rid, tenant=tenant, prompt=prompt, est_tokens=max(1, est_tokens),
-            prefix_hit_prob=prefix_hit_prob, created_ts=time.time(),
+            prefix_hit_prob=prefix_hit_prob, created_ts=monotonic_time(),
             penalty_mult=penalty_mult, penalty_expires=penalty_expire,
             opts=opts or {}, 
-            out_q=asyncio.Queue(), 
+            out_q=asyncio.Queue(maxsize=OUT_Q_MAX),
             done=asyncio.Event(),
         )
         self.reqs[rid] = ctx
         self._enqueue_prefill(ctx)
         return ctx
 
+    async def _finish(self, ctx: RequestCtx):
+        ctx.done.set()
+        self.reqs.pop(ctx.req_id, None)
+        # sentinel wakes the reader even when no delta was produced; a cancelled
+        # ctx has no reader (and its drain unblocks a put already waiting)
+        if ctx.cancelled: return
+        try:
+            ctx.out_q.put_nowait(None)
+        except asyncio.QueueFull:
+            # a cancelled decode task (run() shutting down) can't wait for the reader
+            if asyncio.current_task().cancelling(): return
+            await ctx.out_q.put(None)
+
     def _tenant_weight(self, tenant: str) -> float:
-        tenants = self.spec.scheduling.fair_share.get("tenants", {})
-        return float(tenants.get(tenant, {}).get("weight", 1.0))
+        return self._weights.get(tenant, 1.0)
 
-    def _score(self, ctx: RequestCtx, kind: str) -> float:
-        weight = self._tenant_weight(ctx.tenant)
-        srpt = 1.0 / ctx.est_tokens
-        score = (1.0 / weight) * srpt
-        pol = self.spec.scheduling.policies
-        if pol.prefix_awareness and ctx.prefix_hit_prob > 0.5:
+    def _score(self, ctx: RequestCtx, kind: str, now: float) -> float:
+        # (1/weight) * SRPT
+        score = self._inv_weights.get(ctx.tenant, 1.0) / ctx.est_tokens
+        if self._prefix_aware and ctx.prefix_hit_prob > 0.5:
             score *= 0.7
         # RL deprioritization window
-        if ctx.penalty_mult > 1.0 and (ctx.penalty_expires == 0.0 or monotonic_time() < ctx.penalty_expires):
+        if ctx.penalty_mult > 1.0 and (ctx.penalty_expires == 0.0 or now < ctx.penalty_expires):
             score *= ctx.penalty_mult
-        # aging
-        waited = max(0.0, time.time() - ctx.created_ts)
-        if pol.aging_seconds > 0:
-            score *= max(0.8, 1.0 - min(1.0, waited / pol.aging_seconds) * 0.2)
+        # aging: up to 20% boost once waited >= aging_seconds
+        if self._inv_aging:
+            waited = now - ctx.created_ts
+            if waited > 0.0:
+                score *= 1.0 - min(1.0, waited * self._inv_aging) * 0.2
         if kind == "decode": score *= 0.9
         return score
 
-    def _enqueue_prefill(self, ctx: RequestCtx, offset: int = 0):
+    def _enqueue_prefill(self, ctx: RequestCtx, offset: int = 0, now: float | None = None):
         self.arrival += 1
-        it = _ScoredItem(self._score(ctx, "prefill"), self.arrival, ctx.req_id, "prefill", {"offset": offset})
-        heapq.heappush(self.q, it)
-        Q_PREFILL.set(sum(1 for i in self.q if i.kind == "prefill"))
+        if now is None: now = monotonic_time()
+        it = _ScoredItem(self._score(ctx, "prefill", now), self.arrival, ctx.req_id, "prefill", {"offset": offset})
+        heapq.heappush(self.q_prefill, it)
+        self._ready.set()
 
-    def _enqueue_decode(self, ctx: RequestCtx):
+    def _enqueue_decode(self, ctx: RequestCtx, now: float | None = None):
         self.arrival += 1
-        it = _ScoredItem(self._score(ctx, "decode"), self.arrival, ctx.req_id, "decode", {})
-        heapq.heappush(self.q, it)
-        Q_DECODE.set(sum(1 for i in self.q if i.kind == "decode"))
+        if now is None: now = monotonic_time()
+        it = _ScoredItem(self._score(ctx, "decode", now), self.arrival, ctx.req_id, "decode", {})
+        heapq.heappush(self.q_decode, it)
+        self._ready.set()
+
+    async def _start_decode(self, ctx: RequestCtx, router_callbacks) -> bool:
+        # decode-time rate limit enforcement; never waits here, since the run
+        # loop would stall every tenant behind this one's slot or tokens
+        try:
+            handle, delay = self.rate.try_acquire_for_decode(ctx.tenant, ctx.est_tokens)
+        except RateLimitRetry as e:
+            if not e.queued:
+                RATE_LIMIT_RETRY.labels(tenant=ctx.tenant, reason=e.reason).inc()
+            self._defer(self._requeue_decode(ctx, e.queued))
+            return False
+        except RateLimitError as e:
+            # rejected; end the stream and let the reader raise it
+            ctx.error = e
+            await self._finish(ctx)
+            return False
+        self._spawn(self._decode_tasks, self._run_decode(ctx, handle, router_callbacks, delay))
+        return True
+
+    def _spawn(self, tasks: set[asyncio.Task], coro):
+        t = asyncio.create_task(coro)
+        tasks.add(t)
+        t.add_done_callback(tasks.discard)
+        # a decode slot freed up / a deferred decode is back in qd
+        t.add_done_callback(lambda _: self._ready.set())
+
+    def _defer(self, coro): self._spawn(self._waiters, coro)
+
+    async def _requeue_decode(self, ctx: RequestCtx, queued: bool):
+        # queued: wait for one of the tenant's slots; otherwise a short backoff
+        if queued:
+            await self.rate.wait_slot(ctx.tenant)
+        else:
+            await asyncio.sleep(_RETRY_S)
+        if ctx.cancelled: await self._finish(ctx)
+        else: self._enqueue_decode(ctx)
+
+    async def _run_decode(self, ctx: RequestCtx, handle, router_callbacks, delay: float = 0.0):
+        # own task per stream: a reader that falls OUT_Q_MAX behind blocks only
+        # this put, never the run loop or other requests
+        try:
+            # "queue" tenant short on tokens: charged already, starts after delay
+            if delay: await asyncio.sleep(delay)
+            # aclosing: a break (reader gone) closes the stream now, so engine
+            # in-flight counts and the gRPC call don't wait for GC
+            async with contextlib.aclosing(router_callbacks.decode_stream(ctx)) as stream:
+                async for delta in stream:
+                    if ctx.cancelled: break
+                    await ctx.out_q.put(delta)
+        except Exception as e:
+            log.exception("decode stream failed for %s", ctx.req_id)
+            ctx.error = e if isinstance(e, DecodeError) else DecodeError(f"{ctx.req_id}: {e}")
+        finally:
+            handle.release()
+            await self._finish(ctx)
 
     async def run(self, router_callbacks):
         pol = self.spec.scheduling.policies
         chunk = int(pol.prefill_chunk_tokens)
         min_decode_slots = int(pol.min_decode_slots)
+        max_decodes = int(self.spec.budgets.max_decode_concurrency)
+        qp, qd = self.q_prefill, self.q_decode
+        tasks = self._decode_tasks
+
+        try:
+            while not self._stop.is_set():
+                # depth gauges: one write per tick instead of per enqueue/pop
+                Q_PREFILL.set(len(qp)); Q_DECODE.set(len(qd))
+                # decodes wait in qd while max_decode_concurrency streams are live
+                decode_ok = bool(qd) and (max_decodes <= 0 or len(tasks) < max_decodes)
+                if not qp and not decode_ok:
+                    self._ready.clear()
+                    await self._ready.wait(); continue
+
+                # best head across both heaps; (score, arrival_id) order as before
+                if decode_ok and (not qp or qd[0] < qp[0]):
+                    item = heapq.heappop(qd)
+                else:
+                    item = heapq.heappop(qp)
+                ctx = self.reqs.get(item.req_id)
+                if ctx is None: continue
+
+                if item.kind == "prefill":
+                    off = item.payload.get("offset", 0)
+                    await router_callbacks.prefill_chunk(ctx, off, chunk)
+                    # re-enqueue scores read the clock now: the await above can
+                    # take a whole prefill chunk, so a pre-await reading is stale
+                    off2 = off + chunk
+                    if off2 < ctx.est_tokens and pol.chunked_prefill:
+                        self._enqueue_prefill(ctx, off2)
+                    else:
+                        self._enqueue_decode(ctx)
 
-        while not self._stop.is_set():
-            if not self.q:
-                await asyncio.sleep(0.001); continue
+                else:  # decode
+                    if not await self._start_decode(ctx, router_callbacks): continue
 
-            item = heapq.heappop(self.q)
-            ctx = self.reqs.get(item.req_id)
-            if ctx is None: continue
+                    # start more decodes back-to-back if available
+                    extra = min_decode_slots - 1
+                    while extra > 0 and qd and (max_decodes <= 0 or len(tasks) < max_decodes):
+                        it2 = heapq.heappop(qd)
+                        ctx2 = self.reqs.get(it2.req_id)
+                        if ctx2 and not await self._start_decode(ctx2, router_callbacks): break
+                        extra -= 1
 
-            if item.kind == "prefill":
-                off = item.payload.get("offset", 0)
-                await router_callbacks.prefill_chunk(ctx, off, chunk)
-                off2 = off + chunk
-                if off2 < ctx.est_tokens and pol.chunked_prefill:
-                    self._enqueue_prefill(ctx, off2)
-                else:
-                    self._enqueue_decode(ctx)
-
-            else:  # decode
-                try:
-                    # decode-time rate limit enforcement (may reschedule)
-                    handle = await self.rate.acquire_for_decode(ctx.tenant, ctx.est_tokens)
-                except Exception as e:
-                    from ..util.ratelimit import RateLimitRetry, RateLimitError
-                    if isinstance(e, RateLimitRetry):
-                        RATE_LIMIT_RETRY.labels(tenant=ctx.tenant, reason=e.reason).inc()
-                        # reschedule decode after a short pause
-                        await asyncio.sleep(0.01)
-                        self._enqueue_decode(ctx)
-                        continue
-                    if isinstance(e, RateLimitError):
-                        # rejected; complete with empty stream
-                        ctx.done.set()
-                        continue
-                    raise
-
-                try:
-                    async for delta in router_callbacks.decode_stream(ctx):
-                        await ctx.out_q.put(delta)
-                    ctx.done.set()
-                finally:
-                    handle.release()
-
-                # run more decodes back-to-back if available
-                extra = min_decode_slots - 1
-                while extra > 0:
-                    nxt_i = next((i for i, it in enumerate(self.q) if it.kind == "decode"), None)
-                    if nxt_i is None: break
-                    it2 = self.q.pop(nxt_i); heapq.heapify(self.q)
-                    ctx2 = self.reqs.get(it2.req_id)
-                    if ctx2:
-                        try:
-                            handle2 = await self.rate.acquire_for_decode(ctx2.tenant, ctx2.est_tokens)
-                        except Exception:
-                            # put it back for later
-                            self._enqueue_decode(ctx2)
-                            break
-                        try:
-                            async for delta in router_callbacks.decode_stream(ctx2):
-                                await ctx2.out_q.put(delta)
-                            ctx2.done.set()
-                        finally:
-                            handle2.release()
-                    extra -= 1
-
-    def stop(self): self._stop.set()
\ No newline at end of file
+            # graceful stop: let live streams run to completion
+            if tasks: await asyncio.wait(set(tasks))
+        finally:
+            # cancelled (e.g. Router.stop timed out): don't leave streams behind
+            for t in [*tasks, *self._waiters]: t.cancel()
+
+    def stop(self): self._stop.set(); self._ready.set()
\ No newline at end of file
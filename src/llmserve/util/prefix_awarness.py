@@ -4,6 +4,16 @@ from __future__ import annotations
 import hashlib
 from collections import OrderedDict
 
+try:
+    # non-cryptographic; the key only identifies a prefix inside this process
+    from xxhash import xxh3_128_intdigest as _fingerprint
+except ImportError:
+    def _fingerprint(p: bytes) -> bytes:
+        return hashlib.blake2b(p, digest_size=16).digest()
+
+# sightings -> hit probability; index 5 covers every count >= 5
+_HIT_PROB = (0.1, 0.1, 0.3, 0.5, 0.7, 0.9)
+
 class PrefixHeuristic:
     """
     Lightweight LRU frequency estimator for prefix reuse. Until we tap vLLM's
@@ -12,29 +22,25 @@ class PrefixHeuristic:
     """
     def __init__(self, max_entries: int = 4096):
         self.max = max_entries
-        self.lru: OrderedDict[str, int] = OrderedDict()
+        self.lru: OrderedDict[int | bytes, int] = OrderedDict()
 
     @staticmethod
-    def _prefix_key(prompt: str, first_n_chars: int = 512) -> str:
+    def _prefix_key(prompt: str, first_n_chars: int = 512) -> int | bytes:
         # Hash first N chars (system + first user turn) as a prefix signature
         p = prompt[:first_n_chars].encode("utf-8", errors="ignore")
-        return hashlib.blake2b(p, digest_size=16).hexdigest()
+        return _fingerprint(p)
 
     def observe(self, prompt: str) -> float:
         """
         Record the prefix and return an estimated hit probability in [0,1].
         """
         key = self._prefix_key(prompt)
-        cnt = self.lru.get(key, 0) + 1
-        if key in self.lru:
-            self.lru.move_to_end(key)
-        self.lru[key] = cnt
+        lru = self.lru
+        # pop + reinsert moves the key to the MRU end in one pass
+        cnt = lru.pop(key, 0) + 1
+        lru[key] = cnt
         # evict if needed
-        if len(self.lru) > self.max:
-            self.lru.popitem(last=False)
+        if len(lru) > self.max:
+            lru.popitem(last=False)
         # simple mapping: >=3 sightings -> high probability
-        if cnt >= 5: return 0.9
-        if cnt == 4: return 0.7
-        if cnt == 3: return 0.5
-        if cnt == 2: return 0.3
-        return 0.1
\ No newline at end of file
+        return _HIT_PROB[min(cnt, 5)]
\ No newline at end of file
@@ -1,6 +1,6 @@
 # SPDX-License-Identifier: Apache-2.0
 from __future__ import annotations
-import asyncio, time
+import asyncio
 from dataclasses import dataclass
 from typing import Dict
 from .types import monotonic_time
@@ -9,7 +9,9 @@ class RateLimitError(Exception):
     def __init__(self, tenant: str, reason: str): super().__init__(reason); self.tenant=tenant; self.reason=reason
 
 class RateLimitRetry(Exception):
-    def __init__(self, tenant: str, reason: str): super().__init__(reason); self.tenant=tenant; self.reason=reason
+    # queued: "queue" policy at its concurrency cap; retry after wait_slot(), not a backoff
+    def __init__(self, tenant: str, reason: str, queued: bool = False):
+        super().__init__(reason); self.tenant=tenant; self.reason=reason; self.queued=queued
 
 @dataclass
 class _Bucket:
@@ -27,10 +29,15 @@ class Assessment:
     policy: str  # "deprioritize" | "queue" | "reject"
 
 class _Handle:
-    def __init__(self, release_fn): self._rel = release_fn
-    def release(self): 
-        try: self._rel()
-        except Exception: pass
+    # one concurrency slot; release is idempotent so a second call cannot free
+    # someone else's slot
+    __slots__ = ("_rl", "_tenant", "_released")
+    def __init__(self, rl: "RateLimiter", tenant: str):
+        self._rl = rl; self._tenant = tenant; self._released = False
+    def release(self):
+        if self._released: return
+        self._released = True
+        self._rl._release(self._tenant)
 
 class RateLimiter:
     """
@@ -38,31 +45,48 @@ class RateLimiter:
       (1) assess() at submission -> returns deprioritization tag (no blocking)
       (2) acquire_for_decode() at execution -> enforces concurrency + tokens
           with policies: deprioritize (non-blocking; reschedule on deficit),
-                         queue (wait), reject (raise)
+                         queue (wait), reject (raise);
+          try_acquire_for_decode() is the same gate without waiting
     """
     def __init__(self, spec):
         rl = spec.scheduling.rate_limits or {}
         self.cfg = rl
         self.buckets: Dict[str,_Bucket] = {}
-        self.sems: Dict[str, asyncio.Semaphore] = {}
+        # concurrency gate: plain counters (single event loop); "queue" tenants
+        # park on slot_free until a release
+        self.counts: Dict[str, int] = {}
+        self.max_conc: Dict[str, int] = {}
+        self.slot_free: Dict[str, asyncio.Event] = {}
         now = monotonic_time()
         for tenant, c in rl.items():
             rate = float(c.tokens_per_sec)
             burst = float(c.burst or (rate*2 if rate>0 else 0.0))
             self.buckets[tenant] = _Bucket(rate, burst, burst, now)
-            self.sems[tenant] = asyncio.Semaphore(int(c.max_concurrency) or 1_000_000)
+            self.max_conc[tenant] = int(c.max_concurrency) or 1_000_000
         if "default" not in self.buckets:
             self.buckets["default"] = _Bucket(0.0, 0.0, 0.0, now)
-            self.sems["default"] = asyncio.Semaphore(1_000_000)
+            self.max_conc["default"] = 1_000_000
+        for tenant in self.buckets:
+            self.counts[tenant] = 0
+            self.slot_free[tenant] = asyncio.Event()
         self.spec = spec
+        # per-tenant (policy, deprioritize mult, penalty window s); read on every request
+        self._policy: Dict[str, tuple[str, float, float]] = {}
+        for t in self.buckets:
+            c = self._cfg(t)
+            self._policy[t] = (c.on_exhaustion, float(c.deprioritize_multiplier), int(c.penalty_window_ms) / 1000.0)
 
     def _cfg(self, tenant: str):
         return self.cfg.get(tenant, self.cfg.get("default"))
 
-    def _refill(self, tenant: str):
+    def _release(self, tenant: str):
+        self.counts[tenant] -= 1
+        self.slot_free[tenant].set()
+
+    def _refill(self, tenant: str, now: float | None = None):
         b = self.buckets[tenant]
         if b.rate <= 0: return
-        now = monotonic_time()
+        if now is None: now = monotonic_time()
         dt = now - b.last_ts
         if dt > 0:
             b.tokens = min(b.burst, b.tokens + b.rate*dt)
@@ -70,64 +94,82 @@ class RateLimiter:
 
     def assess(self, tenant: str, est_tokens: int) -> Assessment:
         t = tenant if tenant in self.buckets else "default"
-        pol = self._cfg(t).on_exhaustion
-        mult = float(self._cfg(t).deprioritize_multiplier)
-        win_ms = int(self._cfg(t).penalty_window_ms)
-        self._refill(t)
+        pol, mult, win_s = self._policy[t]
+        now = monotonic_time()
+        self._refill(t, now)
         deficit = max(0.0, est_tokens - self.buckets[t].tokens)
         if pol == "deprioritize" and deficit > 0.0:
-            return Assessment(t, mult, monotonic_time() + (win_ms/1000.0), deficit, pol)
+            return Assessment(t, mult, now + win_s, deficit, pol)
         # queue/reject do not mark penalty at submission
         return Assessment(t, 1.0, 0.0, deficit, pol)
 
-    async def acquire_for_decode(self, tenant: str, cost_tokens: int) -> _Handle:
+    def try_acquire_for_decode(self, tenant: str, cost_tokens: int) -> tuple[_Handle, float]:
+        """
+        Non-blocking acquire_for_decode for the scheduler loop. Returns
+        (handle, delay_s): a "queue" tenant short on tokens is charged now and
+        must wait delay_s before decoding. A "queue" tenant at its concurrency
+        cap gets RateLimitRetry(queued=True); retry after wait_slot().
+        """
         t = tenant if tenant in self.buckets else "default"
-        c = self._cfg(t)
-        policy = c.on_exhaustion
-        sem = self.sems[t]
+        policy = self._policy[t][0]
 
         # concurrency gate
-        if policy == "reject":
-            if sem.locked() or sem._value <= 0:
+        if self.counts[t] >= self.max_conc[t]:
+            if policy == "reject":
                 from ..metrics.prometheus import RATE_LIMIT_REJECTS
                 RATE_LIMIT_REJECTS.labels(tenant=t, reason="concurrency").inc()
                 raise RateLimitError(t, "concurrency")
-            sem.acquire()
-        elif policy == "queue":
-            await sem.acquire()
-        else:  # deprioritize: non-blocking, reschedule if no slot
-            if sem.locked() or sem._value <= 0:
-                from ..metrics.prometheus import RATE_LIMIT_RETRY
-                RATE_LIMIT_RETRY.labels(tenant=t, reason="concurrency").inc()
-                raise RateLimitRetry(t, "concurrency")
-            sem.acquire()
-
-        # tokens bucket
-        try:
-            b = self.buckets[t]
-            self._refill(t)
-            if b.rate <= 0:
-                return _Handle(lambda: sem.release())
-            if b.tokens >= cost_tokens:
-                b.tokens -= cost_tokens
-                return _Handle(lambda: sem.release())
-            if policy == "reject":
-                from ..metrics.prometheus import RATE_LIMIT_REJECTS
-                RATE_LIMIT_REJECTS.labels(tenant=t, reason="tokens").inc()
-                sem.release()
-                raise RateLimitError(t, "tokens")
             if policy == "queue":
-                deficit = cost_tokens - b.tokens
-                wait_s = deficit / max(1e-6, b.rate)
-                await asyncio.sleep(min(wait_s, 2.0))
-                self._refill(t)
-                b.tokens = max(0.0, b.tokens - cost_tokens)
-                return _Handle(lambda: sem.release())
-            # deprioritize: reschedule
+                raise RateLimitRetry(t, "concurrency", queued=True)
+            # deprioritize: non-blocking, reschedule if no slot
             from ..metrics.prometheus import RATE_LIMIT_RETRY
-            RATE_LIMIT_RETRY.labels(tenant=t, reason="tokens").inc()
-            sem.release()
-            raise RateLimitRetry(t, "tokens")
-        except:
-            sem.release()
-            raise
\ No newline at end of file
+            RATE_LIMIT_RETRY.labels(tenant=t, reason="concurrency").inc()
+            raise RateLimitRetry(t, "concurrency")
+
+        # tokens bucket
+        b = self.buckets[t]
+        self._refill(t)
+        if b.rate <= 0 or b.tokens >= cost_tokens:
+            if b.rate > 0: b.tokens -= cost_tokens
+            self.counts[t] += 1
+            return _Handle(self, t), 0.0
+        if policy == "reject":
+            from ..metrics.prometheus import RATE_LIMIT_REJECTS
+            RATE_LIMIT_REJECTS.labels(tenant=t, reason="tokens").inc()
+            raise RateLimitError(t, "tokens")
+        if policy == "queue":
+            # wait for the deficit to refill (capped at 2s), charged up front:
+            # after delay_s the bucket holds max(0, refill - deficit)
+            delay = min((cost_tokens - b.tokens) / max(1e-6, b.rate), 2.0)
+            b.tokens = max(-b.rate * delay, b.tokens - cost_tokens)
+            self.counts[t] += 1
+            return _Handle(self, t), delay
+        # deprioritize: reschedule
+        from ..metrics.prometheus import RATE_LIMIT_RETRY
+        RATE_LIMIT_RETRY.labels(tenant=t, reason="tokens").inc()
+        raise RateLimitRetry(t, "tokens")
+
+    async def wait_slot(self, tenant: str):
+        # park until the tenant is below its concurrency cap
+        t = tenant if tenant in self.buckets else "default"
+        ev, cap = self.slot_free[t], self.max_conc[t]
+        while self.counts[t] >= cap:
+            ev.clear()
+            await ev.wait()
+
+    async def acquire_for_decode(self, tenant: str, cost_tokens: int) -> _Handle:
+        while True:
+            try:
+                handle, delay = self.try_acquire_for_decode(tenant, cost_tokens)
+                break
+            except RateLimitRetry as e:
+                if not e.queued: raise
+                await self.wait_slot(tenant)
+        if delay:
+            try:
+                await asyncio.sleep(delay)
+            except BaseException:
+                # sole release on cancellation during the token wait
+                handle.release()
+                raise
+        return handle
\ No newline at end of file
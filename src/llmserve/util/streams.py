@@ -0,0 +1,44 @@
+# SPDX-License-Identifier: Apache-2.0
+from __future__ import annotations
+import asyncio
+from typing import AsyncIterator
+
+
+async def prefetch_coalesced(src: AsyncIterator[str], prefetch: int, max_chars: int) -> AsyncIterator[str]:
+    """Run `src` ahead into a bounded queue and yield what piled up, joined.
+
+    A background pump drains `src` while the consumer is busy sending the last
+    item; each yield is one queued delta plus whatever followed it, up to
+    `max_chars`. Closing or cancelling the consumer cancels the pump and
+    acloses `src`.
+    """
+    q: asyncio.Queue[str | None] = asyncio.Queue(maxsize=prefetch)
+
+    async def pump():
+        try:
+            async for ch in src:
+                await q.put(ch)
+        finally:
+            aclose = getattr(src, "aclose", None)
+            if aclose is not None: await aclose()
+            # cancelled means the consumer is gone: nobody drains q, and a
+            # blocking put on a full queue would never return
+            if not asyncio.current_task().cancelling():
+                await q.put(None)
+
+    task = asyncio.create_task(pump())
+    try:
+        done = False
+        while not done and (ch := await q.get()) is not None:
+            parts = [ch]; n = len(ch)
+            while n < max_chars and not q.empty():
+                nxt = q.get_nowait()
+                if nxt is None: done = True; break
+                parts.append(nxt); n += len(nxt)
+            yield ch if len(parts) == 1 else "".join(parts)
+        await task  # surface src errors to the caller
+    finally:
+        if not task.done():
+            task.cancel()
+            # let the pump finish closing src before we return
+            await asyncio.wait([task])
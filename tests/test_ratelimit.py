@@ -0,0 +1,45 @@
+# SPDX-License-Identifier: Apache-2.0
+from types import SimpleNamespace as NS
+
+from llmserve.util.ratelimit import RateLimiter
+
+
+def _rl(**kw):
+    d = dict(tokens_per_sec=0.0, burst=0, max_concurrency=0, on_exhaustion="deprioritize",
+             deprioritize_multiplier=1.25, penalty_window_ms=2000)
+    d.update(kw)
+    return NS(**d)
+
+
+def _spec(rate_limits):
+    return NS(scheduling=NS(rate_limits=rate_limits))
+
+
+def _rejected(rl, tenant, cost):
+    a = rl.assess(tenant, cost)
+    return a.policy == "reject" and a.tokens_deficit > 0
+
+
+def test_queue_tenant_not_assessed_against_reject_default():
+    rl = RateLimiter(_spec({
+        "default": _rl(tokens_per_sec=1.0, burst=10, on_exhaustion="reject"),
+        "premium": _rl(tokens_per_sec=1.0, burst=10, on_exhaustion="queue"),
+    }))
+    # premium is configured to queue: never rejected up front
+    assert not _rejected(rl, "premium", 50)
+    assert _rejected(rl, "default", 50)
+    assert not _rejected(rl, "default", 8)
+
+
+def test_unknown_tenant_uses_default_limits():
+    rl = RateLimiter(_spec({"default": _rl(tokens_per_sec=1.0, burst=10, on_exhaustion="reject")}))
+    assert rl.assess("someone", 8).tenant == "default"
+    assert _rejected(rl, "someone", 50)
+
+
+def test_assess_does_not_charge():
+    rl = RateLimiter(_spec({"default": _rl(tokens_per_sec=1.0, burst=10, on_exhaustion="reject")}))
+    # admission checks read the bucket; only decode-time acquire spends it
+    assert all(not _rejected(rl, "default", 8) for _ in range(5))
+    rl.try_acquire_for_decode("default", 8)[0].release()
+    assert _rejected(rl, "default", 8)
@@ -0,0 +1,150 @@
+# SPDX-License-Identifier: Apache-2.0
+import asyncio
+from types import SimpleNamespace as NS
+
+from llmserve.scheduler.fairshare import DecodeError, FairShareScheduler
+from llmserve.util.ratelimit import RateLimiter, RateLimitError
+
+
+def _rl(**kw):
+    d = dict(tokens_per_sec=0.0, burst=0, max_concurrency=0, on_exhaustion="deprioritize",
+             deprioritize_multiplier=1.25, penalty_window_ms=2000)
+    d.update(kw)
+    return NS(**d)
+
+
+def _spec(rate_limits, max_decode_concurrency=12):
+    pol = NS(chunked_prefill=True, prefill_chunk_tokens=512, min_decode_slots=2,
+             prefix_awareness=False, aging_seconds=2.0)
+    return NS(scheduling=NS(rate_limits=rate_limits, fair_share={}, policies=pol),
+              budgets=NS(max_decode_concurrency=max_decode_concurrency))
+
+
+class _Callbacks:
+    """Decode stream of `n` deltas, `dt` apart, per prompt "name:n:dt"."""
+    def __init__(self):
+        self.produced = {}
+        self.closed = set()
+        # held like a live RPC: an abandoned stream is not finalized by GC here
+        self.streams = []
+
+    async def prefill_chunk(self, ctx, start_token, n_tokens):
+        await asyncio.sleep(0)
+
+    def decode_stream(self, ctx):
+        stream = self._stream(ctx)
+        self.streams.append(stream)
+        return stream
+
+    async def _stream(self, ctx):
+        name, n, dt = ctx.prompt.split(":")
+        try:
+            for i in range(int(n)):
+                if name == "fail" and i == 2: raise RuntimeError("engine died")
+                await asyncio.sleep(float(dt))
+                self.produced[name] = i + 1
+                yield f"{name}{i} "
+        finally:
+            self.closed.add(name)
+
+
+async def _read(ctx, limit=None):
+    # same protocol as Router.submit_and_stream
+    out = []
+    q = ctx.out_q
+    finished = False
+    try:
+        while (d := await q.get()) is not None:
+            out.append(d)
+            if limit and len(out) >= limit: break
+        else:
+            finished = True
+    finally:
+        if not finished:
+            ctx.cancelled = True
+            while not q.empty(): q.get_nowait()
+    return out
+
+
+async def _submit(s, tenant, prompt):
+    return await s.submit(tenant, prompt, 10, 0.0, 1.0, 0.0, {})
+
+
+def _run(spec, body):
+    async def main():
+        s = FairShareScheduler(spec, RateLimiter(spec))
+        cb = _Callbacks()
+        task = asyncio.create_task(s.run(cb))
+        try:
+            return await body(s, cb)
+        finally:
+            s.stop()
+            task.cancel()
+            await asyncio.wait([task])
+    return asyncio.run(main())
+
+
+def test_queued_tenant_does_not_block_others():
+    spec = _spec({
+        "a": _rl(max_concurrency=1, on_exhaustion="queue"),
+        "default": _rl(),
+    })
+
+    async def body(s, cb):
+        loop = asyncio.get_running_loop()
+        a1 = await _submit(s, "a", "a1:1:1.0")
+        a2 = await _submit(s, "a", "a2:1:0.01")  # waits for a1's slot
+        await asyncio.sleep(0.05)
+        t0 = loop.time()
+        b = await _submit(s, "default", "b:1:0.01")
+        assert await asyncio.wait_for(_read(b), 0.5) == ["b0 "]
+        assert loop.time() - t0 < 0.5
+        # a2 still gets its turn once a1 is done
+        await asyncio.wait_for(_read(a1), 2)
+        assert await asyncio.wait_for(_read(a2), 2) == ["a20 "]
+
+    _run(spec, body)
+
+
+def test_reject_ends_stream_with_sentinel():
+    spec = _spec({"default": _rl(max_concurrency=1, on_exhaustion="reject")})
+
+    async def body(s, cb):
+        first = await _submit(s, "default", "first:3:0.05")
+        await asyncio.sleep(0.02)
+        second = await _submit(s, "default", "second:3:0.01")
+        assert await asyncio.wait_for(_read(second), 0.5) == []
+        assert "second" not in cb.produced
+        assert isinstance(second.error, RateLimitError)
+        assert len(await asyncio.wait_for(_read(first), 1)) == 3
+
+    _run(spec, body)
+
+
+def test_cancelled_reader_stops_producer():
+    spec = _spec({"default": _rl()})
+
+    async def body(s, cb):
+        ctx = await _submit(s, "default", "long:1000:0.001")
+        assert len(await asyncio.wait_for(_read(ctx, limit=2), 1)) == 2
+        await asyncio.sleep(0.05)
+        assert cb.produced["long"] < 1000
+        assert "long" in cb.closed  # generator closed, not left for GC
+        assert not s.reqs and not s._decode_tasks
+
+    _run(spec, body)
+
+
+def test_failed_stream_reports_error():
+    spec = _spec({"default": _rl()})
+
+    async def body(s, cb):
+        ctx = await _submit(s, "default", "fail:5:0.001")
+        # truncated output is followed by the sentinel and a recorded error
+        assert len(await asyncio.wait_for(_read(ctx), 1)) == 2
+        assert isinstance(ctx.error, DecodeError)
+        ok = await _submit(s, "default", "ok:2:0.001")
+        assert len(await asyncio.wait_for(_read(ok), 1)) == 2
+        assert ok.error is None
+
+    _run(spec, body)
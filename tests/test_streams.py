@@ -0,0 +1,64 @@
+# SPDX-License-Identifier: Apache-2.0
+import asyncio
+
+from llmserve.util.streams import prefetch_coalesced
+
+
+class _Source:
+    """Endless delta stream that records whether it was aclose'd."""
+    def __init__(self):
+        self.closed = False
+
+    async def _gen(self):
+        try:
+            while True:
+                yield "x"
+        finally:
+            self.closed = True
+
+    def __aiter__(self):
+        self._it = self._gen()
+        return self._it
+
+    async def aclose(self):
+        await self._it.aclose()
+
+
+def test_coalesces_and_terminates():
+    async def src():
+        for ch in ("a", "b", "c"):
+            yield ch
+
+    async def main():
+        return [d async for d in prefetch_coalesced(src(), 8, 256)]
+
+    assert "".join(asyncio.run(main())) == "abc"
+
+
+def test_consumer_cancelled_while_queue_full():
+    src = _Source()
+
+    async def consume(started: asyncio.Event):
+        # same shape as DecodeRPC.DecodeStream
+        deltas = prefetch_coalesced(src, 4, 1)
+        try:
+            async for _ in deltas:
+                started.set()
+                await asyncio.sleep(3600)  # stalled client: the pump fills the queue
+        finally:
+            await deltas.aclose()
+
+    async def main():
+        started = asyncio.Event()
+        task = asyncio.create_task(consume(started))
+        await started.wait()
+        for _ in range(10): await asyncio.sleep(0)
+        task.cancel()
+        await asyncio.wait_for(asyncio.wait([task]), timeout=1)
+        pending = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+        return task.cancelled(), pending
+
+    cancelled, pending = asyncio.run(main())
+    assert cancelled
+    assert not pending  # pump task did not leak
+    assert src.closed   # and the source generator was closed